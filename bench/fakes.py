@@ -0,0 +1,306 @@
+"""Локальные заглушки GitHub API, CDN файлов релизов и Telegram Bot API для бенчмарка.
+
+Все три сервера запускаются в отдельном процессе (serve), чтобы их работа не отнимала
+время у цикла событий измеряемого бота. Каждый сервер отдаёт счётчики по GET /_stats.
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from dataclasses import dataclass
+from aiohttp import web
+
+@dataclass
+class FakeOptions:
+    apps: int = 10
+    assets: int = 3
+    asset_size: int = 1024 * 1024
+    # Задержка ответа (секунды) и доля ответов с ошибкой 5xx для каждого сервера
+    gh_latency: float = 0.05
+    gh_error_rate: float = 0.0
+    cdn_latency: float = 0.02
+    cdn_error_rate: float = 0.0
+    tg_latency: float = 0.03
+    tg_error_rate: float = 0.0
+    # Лимиты: запросов к GitHub за окно в час, сообщений Telegram в секунду (общий и на чат)
+    gh_rate_limit: int = 5000
+    tg_rate: float = 30.0
+    tg_chat_rate: float = 1.0
+    tg_chat_burst: int = 3
+
+def repo_name(index: int) -> str:
+    return f"bench/repo{index}"
+
+def asset_name(index: int) -> str:
+    return f"app-{index}.apk"
+
+class _Bucket:
+    """Маркерная корзина заглушки: отказ вместо ожидания, как у настоящего API."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Забирает маркер и возвращает 0 или через сколько секунд он появится."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class _Server:
+    def __init__(self, options: FakeOptions):
+        self.options = options
+        self.stats = {}
+        self.runner = None
+        self.port = None
+
+    def count(self, name: str, value: int = 1):
+        self.stats[name] = self.stats.get(name, 0) + value
+
+    async def get_stats(self, request):
+        return web.json_response(self.stats)
+
+    def routes(self, app: web.Application):
+        raise NotImplementedError
+
+    async def start(self) -> int:
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_get("/_stats", self.get_stats)
+        self.routes(app)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0, backlog=1024)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+class FakeGitHub(_Server):
+    """GitHub REST (releases/latest с ETag) и GraphQL с заголовками X-RateLimit-*."""
+
+    def __init__(self, options: FakeOptions, cdn_url: str):
+        super().__init__(options)
+        self.cdn_url = cdn_url
+        self.tags = {repo_name(i): "v1" for i in range(options.apps)}
+        self.window_start = time.time()
+        self.used = 0
+
+    def routes(self, app):
+        app.router.add_get("/repos/{owner}/{repo}/releases/latest", self.latest_release)
+        app.router.add_post("/graphql", self.graphql)
+        app.router.add_post("/_bump", self.bump)
+
+    def release(self, repo: str) -> dict:
+        tag = self.tags[repo]
+        return {
+            "tag_name": tag,
+            "name": f"{repo} {tag}",
+            "body": "Benchmark release",
+            "assets": [
+                {
+                    "name": asset_name(j),
+                    "size": self.options.asset_size,
+                    "browser_download_url": f"{self.cdn_url}/{repo}/{tag}/{asset_name(j)}",
+                }
+                for j in range(self.options.assets)
+            ],
+        }
+
+    def rate_headers(self) -> dict:
+        if time.time() - self.window_start >= 3600:
+            self.window_start, self.used = time.time(), 0
+        return {
+            "X-RateLimit-Limit": str(self.options.gh_rate_limit),
+            "X-RateLimit-Remaining": str(max(0, self.options.gh_rate_limit - self.used)),
+            "X-RateLimit-Reset": str(int(self.window_start + 3600)),
+        }
+
+    async def admit(self, resource: str):
+        """Общая часть запроса: задержка, лимит и случайные ошибки. Возвращает ответ-отказ или None."""
+        self.count("requests")
+        await asyncio.sleep(self.options.gh_latency)
+        headers = self.rate_headers()
+        headers["X-RateLimit-Resource"] = resource
+        if self.used >= self.options.gh_rate_limit:
+            self.count("rate_limited")
+            return web.json_response({"message": "API rate limit exceeded"}, status=403, headers=headers)
+        if random.random() < self.options.gh_error_rate:
+            self.count("errors")
+            return web.json_response({"message": "Server Error"}, status=502, headers=headers)
+        return None
+
+    async def latest_release(self, request):
+        rejected = await self.admit("core")
+        if rejected:
+            return rejected
+        repo = f"{request.match_info['owner']}/{request.match_info['repo']}"
+        if repo not in self.tags:
+            return web.json_response({"message": "Not Found"}, status=404)
+        etag = f'"{repo}@{self.tags[repo]}"'
+        if request.headers.get("If-None-Match") == etag:
+            # Условные запросы с ответом 304 GitHub не засчитывает в лимит
+            self.count("not_modified")
+            return web.Response(status=304, headers={"ETag": etag, **self.rate_headers()})
+        self.used += 1
+        return web.json_response(self.release(repo), headers={"ETag": etag, **self.rate_headers()})
+
+    async def graphql(self, request):
+        rejected = await self.admit("graphql")
+        if rejected:
+            return rejected
+        self.used += 1
+        variables = (await request.json())["variables"]
+        data, errors = {}, []
+        for i in itertools.count():
+            if f"o{i}" not in variables:
+                break
+            repo = f"{variables[f'o{i}']}/{variables[f'n{i}']}"
+            if repo not in self.tags:
+                data[f"r{i}"] = None
+                errors.append({"path": [f"r{i}"], "message": f"Could not resolve to a Repository '{repo}'"})
+                continue
+            release = self.release(repo)
+            data[f"r{i}"] = {"latestRelease": {
+                "tagName": release["tag_name"],
+                "name": release["name"],
+                "description": release["body"],
+                "releaseAssets": {"nodes": [
+                    {"name": a["name"], "size": a["size"], "downloadUrl": a["browser_download_url"]}
+                    for a in release["assets"]
+                ]},
+            }}
+        body = {"data": data}
+        if errors:
+            body["errors"] = errors
+        return web.json_response(body, headers=self.rate_headers())
+
+    async def bump(self, request):
+        """Публикует новый релиз во всех репозиториях."""
+        for repo, tag in self.tags.items():
+            self.tags[repo] = f"v{int(tag[1:]) + 1}"
+        return web.json_response({"ok": True})
+
+class FakeCDN(_Server):
+    """Отдаёт файлы релизов заданного размера потоком."""
+
+    CHUNK = b"\0" * 65536
+
+    def routes(self, app):
+        app.router.add_get("/{owner}/{repo}/{tag}/{name}", self.download)
+
+    async def download(self, request):
+        self.count("requests")
+        await asyncio.sleep(self.options.cdn_latency)
+        if random.random() < self.options.cdn_error_rate:
+            self.count("errors")
+            return web.Response(status=503)
+        size = self.options.asset_size
+        response = web.StreamResponse(headers={"Content-Length": str(size)})
+        await response.prepare(request)
+        sent = 0
+        while sent < size:
+            chunk = self.CHUNK[:min(len(self.CHUNK), size - sent)]
+            await response.write(chunk)
+            sent += len(chunk)
+        self.count("bytes", sent)
+        await response.write_eof()
+        return response
+
+class FakeBotAPI(_Server):
+    """Telegram Bot API: sendDocument, sendMediaGroup, sendMessage и прочие методы с ответом-заглушкой."""
+
+    def __init__(self, options: FakeOptions):
+        super().__init__(options)
+        self.ids = itertools.count(1)
+        self.global_bucket = _Bucket(options.tg_rate, options.tg_rate)
+        self.chat_buckets = {}
+
+    def routes(self, app):
+        app.router.add_post("/bot{token}/{method}", self.call)
+
+    def throttle(self, chat_id: int) -> float:
+        wait = self.global_bucket.take()
+        if not wait and self.options.tg_chat_rate > 0:
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self.chat_buckets[chat_id] = _Bucket(self.options.tg_chat_rate, self.options.tg_chat_burst)
+            wait = bucket.take()
+        return wait
+
+    def message(self, chat_id: int, document: str = None) -> dict:
+        message = {
+            "message_id": next(self.ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+        }
+        if document:
+            message["document"] = {"file_id": document, "file_unique_id": document}
+        return message
+
+    def document_id(self, form, value) -> str:
+        """Возвращает file_id для поля document: новый при загрузке, тот же при повторной отправке."""
+        if isinstance(value, str) and value.startswith("attach://"):
+            value = form.get(value[len("attach://"):])
+        if isinstance(value, web.FileField):
+            self.count("uploads")
+            value.file.seek(0, 2)
+            self.count("bytes", value.file.tell())
+            return f"file-{value.filename}-{next(self.ids)}"
+        self.count("file_id_sends")
+        return value
+
+    async def call(self, request):
+        method = request.match_info["method"].lower()
+        self.count("requests")
+        form = await request.post()
+        await asyncio.sleep(self.options.tg_latency)
+        chat_id = int(form.get("chat_id") or 0)
+        if method == "getme":
+            return web.json_response({"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}})
+        if method.startswith("send"):
+            retry_after = self.throttle(chat_id)
+            if retry_after:
+                self.count("rate_limited")
+                return web.json_response({
+                    "ok": False, "error_code": 429,
+                    "description": f"Too Many Requests: retry after {int(retry_after) + 1}",
+                    "parameters": {"retry_after": int(retry_after) + 1},
+                })
+            if random.random() < self.options.tg_error_rate:
+                self.count("errors")
+                return web.json_response({"ok": False, "error_code": 500, "description": "Internal Server Error"})
+        if method == "senddocument":
+            self.count("messages")
+            return web.json_response({"ok": True, "result": self.message(chat_id, self.document_id(form, form["document"]))})
+        if method == "sendmediagroup":
+            media = json.loads(form["media"])
+            self.count("messages", len(media))
+            return web.json_response({"ok": True, "result": [
+                self.message(chat_id, self.document_id(form, item["media"])) for item in media
+            ]})
+        if method.startswith("send"):
+            self.count("messages")
+        return web.json_response({"ok": True, "result": self.message(chat_id)})
+
+async def _serve(options: FakeOptions, conn):
+    cdn = FakeCDN(options)
+    cdn_port = await cdn.start()
+    github = FakeGitHub(options, f"http://127.0.0.1:{cdn_port}")
+    bot_api = FakeBotAPI(options)
+    conn.send({"github": await github.start(), "cdn": cdn_port, "telegram": await bot_api.start()})
+    await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+    for server in (github, cdn, bot_api):
+        await server.stop()
+
+def serve(options: dict, conn):
+    """Точка входа дочернего процесса: запускает заглушки и отправляет их порты в conn."""
+    asyncio.run(_serve(FakeOptions(**options), conn))
@@ -0,0 +1,245 @@
+"""Сквозной бенчмарк бота без реальных GitHub и Telegram.
+
+Запуск из корня репозитория:
+    python -m bench.run --apps 50 --subscribers 200 --assets 3 --downloads 100
+
+Заглушки GitHub API, CDN и Bot API работают в дочернем процессе (bench/fakes.py).
+Бот получает их адреса через переменные окружения, поэтому любые настройки бота
+(TELEGRAM_GLOBAL_RATE, POLL_CONCURRENCY и т. д.) задаются как обычно: VAR=... python -m bench.run.
+Сценарии: рассылка нового релиза всем подписчикам, повторный опрос без изменений
+и одновременные скачивания по кнопке.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+import aiohttp
+from bench.fakes import FakeOptions, serve, repo_name
+
+SERVERS = ("github", "cdn", "telegram")
+BOT_TOKEN = "123456:BENCHMARK"
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк рассылки и скачивания релизов")
+    parser.add_argument("--apps", type=int, default=10, help="число приложений (N)")
+    parser.add_argument("--subscribers", type=int, default=50, help="подписчиков на приложение (M)")
+    parser.add_argument("--assets", type=int, default=3, help="файлов в релизе (K)")
+    parser.add_argument("--asset-size", type=int, default=1024 * 1024, help="размер файла, байт")
+    parser.add_argument("--group-ratio", type=float, default=0.0, help="доля подписчиков-групп")
+    parser.add_argument("--downloads", type=int, default=50, help="одновременных скачиваний по кнопке")
+    parser.add_argument("--album", action="store_true", help="отправлять файлы релиза альбомами (sendMediaGroup)")
+    parser.add_argument("--backend", choices=("rest", "graphql"), default="rest", help="POLL_BACKEND бота")
+    parser.add_argument("--gh-latency", type=float, default=50, help="задержка GitHub, мс")
+    parser.add_argument("--gh-error-rate", type=float, default=0.0, help="доля ответов GitHub 502")
+    parser.add_argument("--gh-rate-limit", type=int, default=5000, help="лимит запросов к GitHub в час")
+    parser.add_argument("--cdn-latency", type=float, default=20, help="задержка CDN, мс")
+    parser.add_argument("--cdn-error-rate", type=float, default=0.0, help="доля ответов CDN 503")
+    parser.add_argument("--tg-latency", type=float, default=30, help="задержка Bot API, мс")
+    parser.add_argument("--tg-error-rate", type=float, default=0.0, help="доля ответов Bot API 500")
+    parser.add_argument("--tg-rate", type=float, default=30, help="лимит Bot API, сообщений/с")
+    parser.add_argument("--tg-chat-rate", type=float, default=1, help="лимит Bot API на чат, сообщений/с (0 - без лимита)")
+    parser.add_argument("--json", help="сохранить результаты в JSON-файл")
+    parser.add_argument("--log-level", default="WARNING", help="уровень логов бота")
+    return parser.parse_args()
+
+def fake_options(args: argparse.Namespace) -> FakeOptions:
+    return FakeOptions(
+        apps=args.apps,
+        assets=args.assets,
+        asset_size=args.asset_size,
+        gh_latency=args.gh_latency / 1000,
+        gh_error_rate=args.gh_error_rate,
+        gh_rate_limit=args.gh_rate_limit,
+        cdn_latency=args.cdn_latency / 1000,
+        cdn_error_rate=args.cdn_error_rate,
+        tg_latency=args.tg_latency / 1000,
+        tg_error_rate=args.tg_error_rate,
+        tg_rate=args.tg_rate,
+        tg_chat_rate=args.tg_chat_rate,
+    )
+
+def peak_rss_mb() -> float:
+    """Пиковый объём памяти процесса бота (без заглушек), МБ."""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS - байты
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+class Bench:
+    def __init__(self, args: argparse.Namespace, urls: dict):
+        self.args = args
+        self.urls = urls
+        self.results = []
+        self.client = None
+
+    async def stats(self) -> dict:
+        result = {}
+        for name in SERVERS:
+            async with self.client.get(f"{self.urls[name]}/_stats") as resp:
+                result[name] = await resp.json()
+        return result
+
+    async def measure(self, name: str, scenario, **extra):
+        """Выполняет сценарий и сохраняет время, разницу счётчиков заглушек и пиковую память."""
+        before = await self.stats()
+        started = time.perf_counter()
+        details = await scenario() or {}
+        elapsed = time.perf_counter() - started
+        after = await self.stats()
+        delta = {
+            server: {key: value - before[server].get(key, 0) for key, value in after[server].items()}
+            for server in SERVERS
+        }
+        messages = delta["telegram"].get("messages", 0)
+        result = {
+            "scenario": name,
+            "seconds": round(elapsed, 3),
+            "messages": messages,
+            "messages_per_second": round(messages / elapsed, 1) if elapsed else 0.0,
+            "uploads": delta["telegram"].get("uploads", 0),
+            "telegram_requests": delta["telegram"].get("requests", 0),
+            "github_requests": delta["github"].get("requests", 0),
+            "cdn_bytes": delta["cdn"].get("bytes", 0),
+            "telegram_bytes": delta["telegram"].get("bytes", 0),
+            "rate_limited": delta["telegram"].get("rate_limited", 0) + delta["github"].get("rate_limited", 0),
+            "errors": sum(delta[server].get("errors", 0) for server in SERVERS),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            **details,
+            **extra,
+        }
+        self.results.append(result)
+        print_row(result)
+        return result
+
+def print_header():
+    print(f"{'Сценарий':<16}{'Время, с':>10}{'Сообщ.':>9}{'Сообщ./с':>10}{'Запр. TG':>10}{'Загрузок':>10}"
+          f"{'GitHub':>8}{'CDN, МБ':>9}{'TG, МБ':>9}{'429':>6}{'Ошибок':>8}{'RSS, МБ':>9}")
+
+def print_row(result: dict):
+    print(f"{result['scenario']:<16}{result['seconds']:>10.2f}{result['messages']:>9}"
+          f"{result['messages_per_second']:>10.1f}{result['telegram_requests']:>10}{result['uploads']:>10}"
+          f"{result['github_requests']:>8}"
+          f"{result['cdn_bytes'] / 2 ** 20:>9.1f}{result['telegram_bytes'] / 2 ** 20:>9.1f}"
+          f"{result['rate_limited']:>6}{result['errors']:>8}{result['peak_rss_mb']:>9.1f}")
+    if "latency_p50" in result:
+        print(f"{'':<16}задержка скачивания: p50 {result['latency_p50']:.2f} с, "
+              f"p95 {result['latency_p95']:.2f} с, max {result['latency_max']:.2f} с")
+
+async def run(args: argparse.Namespace, urls: dict, workdir: str):
+    # Настройки бота читаются при импорте bot.config, поэтому окружение задаётся до импорта
+    os.environ["GITHUB_API_URL"] = urls["github"]
+    os.environ["GITHUB_GRAPHQL_URL"] = f"{urls['github']}/graphql"
+    os.environ["DB_PATH"] = os.path.join(workdir, "bench.db")
+    os.environ["ASSET_CACHE_DIR"] = os.path.join(workdir, "asset_cache")
+    os.environ["POLL_BACKEND"] = args.backend
+    # Бенчмарк запускает один экземпляр, который сразу становится ведущим
+    os.environ["LEADER_BACKEND"] = "none"
+    if args.backend == "graphql":
+        os.environ.setdefault("GITHUB_TOKEN", "benchmark")
+
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from bot import services, storage
+    from bot.asset_cache import hold_assets
+    from bot.asset_filters import get_matcher
+    from bot.http_client import close_http_session
+    from bot.leader import leader
+    from bot.models import App
+
+    bench = Bench(args, urls)
+    bench.client = aiohttp.ClientSession()
+    bot = Bot(BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(urls["telegram"])))
+    await storage.init_db()
+    await leader.start()
+    try:
+        groups = int(args.subscribers * args.group_ratio)
+        for i in range(args.apps):
+            app = App(f"app{i}", f"App {i}", f"https://example.com/app{i}", repo_name(i), ["*.apk"], [], [],
+                      album=args.album)
+            await storage.save_app(app)
+            base = i * args.subscribers + 1
+            await asyncio.gather(*(
+                storage.subscribe(app.key, -(base + j), storage.KIND_CHAT) if j < groups
+                else storage.subscribe(app.key, base + j, storage.KIND_USER)
+                for j in range(args.subscribers)
+            ))
+        print(f"Приложений: {args.apps}, подписчиков на приложение: {args.subscribers}, "
+              f"файлов в релизе: {args.assets} по {args.asset_size / 2 ** 20:.2f} МБ")
+        print_header()
+
+        async def sweep():
+            await services.check_releases(bot)
+            drain = services.start_outbox_drain(bot)
+            if drain:
+                await drain
+            return {"pending": await storage.count_pending_deliveries()}
+
+        await bench.measure("рассылка", sweep)
+        await bench.measure("опрос без новых", sweep)
+
+        async def downloads():
+            latencies = []
+
+            async def press(n: int):
+                app = storage.get_all_apps()[n % args.apps]
+                chat_id = 10 ** 9 + n
+                started = time.perf_counter()
+                release = await services.get_cached_release(app.repo)
+                caption = f"{app.title}: {release['name']}"
+                assets = get_matcher(app).select(release['assets'])
+                with hold_assets(app.repo, release['tag_name'], assets):
+                    await services.prefetch_assets(app.repo, release['tag_name'], assets[1:])
+                    for index, group in enumerate(services.asset_groups(assets, app.album)):
+                        await services.send_assets(bot, chat_id, app.repo, release['tag_name'], group,
+                                                   caption if index == 0 else None, interactive=True)
+                latencies.append(time.perf_counter() - started)
+
+            outcomes = await asyncio.gather(*(press(n) for n in range(args.downloads)), return_exceptions=True)
+            failed = sum(isinstance(outcome, Exception) for outcome in outcomes)
+            if not latencies:
+                return {"failed": failed}
+            latencies.sort()
+            return {
+                "failed": failed,
+                "latency_p50": statistics.median(latencies),
+                "latency_p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                "latency_max": latencies[-1],
+            }
+
+        if args.downloads:
+            await bench.measure("скачивания", downloads)
+    finally:
+        await leader.stop()
+        await bench.client.close()
+        await close_http_session()
+        await bot.session.close()
+        await storage.close_db()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"options": vars(args), "results": bench.results}, file, ensure_ascii=False, indent=2)
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parent, child = multiprocessing.Pipe()
+    fakes = multiprocessing.get_context("spawn").Process(target=serve, args=(asdict(fake_options(args)), child), daemon=True)
+    fakes.start()
+    try:
+        ports = parent.recv()
+        urls = {name: f"http://127.0.0.1:{port}" for name, port in ports.items()}
+        with tempfile.TemporaryDirectory(prefix="bot-bench-") as workdir:
+            asyncio.run(run(args, urls, workdir))
+    finally:
+        parent.send("stop")
+        fakes.join(timeout=10)
+
+if __name__ == "__main__":
+    main()
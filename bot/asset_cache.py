@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+import weakref
+from contextlib import contextmanager
+from typing import AsyncGenerator, BinaryIO, Dict, FrozenSet, Iterable, Iterator, Optional
+from aiogram import Bot
+from aiogram.types import InputFile
+from bot.config import (
+    ASSET_CACHE_DIR, ASSET_CACHE_MAX_BYTES, ASSET_DOWNLOAD_CHUNK, ASSET_PREFETCH_CONCURRENCY, TELEGRAM_API_CACHE_DIR
+)
+from bot.http_client import get_http_session, github_headers
+from bot.metrics import ASSET_FETCHES, ASSET_DOWNLOAD_BYTES, ASSET_DOWNLOAD_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+# Фоновые скачивания следующих файлов релиза: путь в кэше -> задача
+_prefetches: Dict[str, asyncio.Task] = {}
+_prefetch_slots = asyncio.Semaphore(ASSET_PREFETCH_CONCURRENCY)
+
+# Файлы, которые сейчас отправляются или ждут отправки: путь в кэше -> число держателей.
+# Вытеснение их не трогает, даже если кэш больше ASSET_CACHE_MAX_BYTES.
+_holds: Dict[str, int] = {}
+
+def asset_path(repo: str, tag: str, asset: dict) -> str:
+    """Возвращает путь к файлу в кэше. Имя - хэш (репозиторий, тег, имя файла, размер)."""
+    key = f"{repo}\0{tag}\0{asset['name']}\0{asset.get('size', '')}"
+    return os.path.join(ASSET_CACHE_DIR, hashlib.sha256(key.encode()).hexdigest())
+
+def _lock(path: str) -> asyncio.Lock:
+    lock = _locks.get(path)
+    if lock is None:
+        lock = asyncio.Lock()
+        _locks[path] = lock
+    return lock
+
+async def fetch_asset(repo: str, tag: str, asset: dict) -> Optional[str]:
+    """Возвращает путь к файлу релиза в дисковом кэше, скачивая его по частям при промахе.
+
+    Файл пишется блоками по ASSET_DOWNLOAD_CHUNK байт, поэтому расход памяти не зависит
+    от размера файла. Возвращает None, если файл недоступен.
+    """
+    path = asset_path(repo, tag, asset)
+    async with _lock(path):
+        if os.path.exists(path):
+            # Время изменения служит отметкой последнего использования для вытеснения
+            os.utime(path)
+            ASSET_FETCHES.inc(result="hit")
+            return path
+        os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+        # Уникальное имя: другой экземпляр с тем же ASSET_CACHE_DIR может качать этот же файл одновременно
+        fd, part_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix=".part", dir=ASSET_CACHE_DIR)
+        asset_url = asset['browser_download_url']
+        started = time.perf_counter()
+        try:
+            with open(fd, "wb") as file:
+                async with get_http_session().get(asset_url, headers=github_headers()) as resp:
+                    if resp.status != 200:
+                        logger.error(f"Файл недоступен: {asset_url}, статус {resp.status}")
+                        ASSET_FETCHES.inc(result="error")
+                        os.remove(part_path)
+                        return None
+                    async for chunk in resp.content.iter_chunked(ASSET_DOWNLOAD_CHUNK):
+                        await asyncio.to_thread(file.write, chunk)
+            size = os.path.getsize(part_path)
+            if asset.get('size') and size != asset['size']:
+                logger.error(f"Файл {asset['name']} скачан не полностью: {size} из {asset['size']} байт")
+                os.remove(part_path)
+                ASSET_FETCHES.inc(result="error")
+                return None
+            os.replace(part_path, path)
+        except BaseException:
+            ASSET_FETCHES.inc(result="error")
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        ASSET_FETCHES.inc(result="miss")
+        ASSET_DOWNLOAD_BYTES.inc(size)
+        ASSET_DOWNLOAD_SECONDS.observe(time.perf_counter() - started)
+        logger.info(f"Файл {asset['name']} ({size} байт) сохранён в кэш")
+    await asyncio.to_thread(evict, path, frozenset(_holds))
+    return path
+
+@contextmanager
+def hold_assets(repo: str, tag: str, assets: Iterable[dict]) -> Iterator[None]:
+    """Защищает файлы релиза от вытеснения из кэша, пока выполняется блок.
+
+    Файлы, которые ещё не скачаны, тоже защищаются: так заранее скачанный файл
+    доживёт до своей отправки.
+    """
+    paths = [asset_path(repo, tag, asset) for asset in assets]
+    for path in paths:
+        _holds[path] = _holds.get(path, 0) + 1
+    try:
+        yield
+    finally:
+        for path in paths:
+            if _holds[path] == 1:
+                del _holds[path]
+            else:
+                _holds[path] -= 1
+
+async def open_asset(repo: str, tag: str, asset: dict) -> Optional[BinaryIO]:
+    """Скачивает файл в кэш (см. fetch_asset) и открывает его на чтение. Закрывает файл вызывающий.
+
+    Открытый файл читается и после удаления с диска, поэтому вытеснение другим экземпляром
+    с общим ASSET_CACHE_DIR не прерывает загрузку. Если файл удалили до открытия, он скачивается заново.
+    """
+    for attempt in range(2):
+        path = await fetch_asset(repo, tag, asset)
+        if not path:
+            return None
+        try:
+            return open(path, "rb")
+        except FileNotFoundError:
+            logger.warning(f"Файл {asset['name']} вытеснен из кэша до отправки, скачиваем заново")
+    return None
+
+class CachedInputFile(InputFile):
+    """Открытый файл кэша для загрузки в Telegram. Читается с начала при каждой попытке отправки."""
+
+    def __init__(self, file: BinaryIO, filename: str):
+        super().__init__(filename=filename)
+        self.file = file
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        await asyncio.to_thread(self.file.seek, 0)
+        while chunk := await asyncio.to_thread(self.file.read, self.chunk_size):
+            yield chunk
+
+def prefetch_asset(repo: str, tag: str, asset: dict) -> asyncio.Task:
+    """Скачивает файл в кэш в фоне, не больше ASSET_PREFETCH_CONCURRENCY файлов одновременно.
+
+    Повторный вызов для того же файла возвращает уже идущую задачу. Ошибки только логируются:
+    отправка файла сама повторит скачивание через fetch_asset.
+    """
+    path = asset_path(repo, tag, asset)
+    task = _prefetches.get(path)
+    if task is None:
+        async def prefetch() -> Optional[str]:
+            try:
+                async with _prefetch_slots:
+                    return await fetch_asset(repo, tag, asset)
+            except Exception as e:
+                logger.warning(f"Не удалось заранее скачать {asset['name']}: {e}")
+                return None
+            finally:
+                _prefetches.pop(path, None)
+        task = _prefetches[path] = asyncio.create_task(prefetch())
+    return task
+
+def evict(keep: str = None, held: FrozenSet[str] = frozenset()):
+    """Удаляет давно не использованные файлы, пока кэш не уложится в ASSET_CACHE_MAX_BYTES.
+
+    Файл keep и файлы из held (см. hold_assets) не удаляются.
+    """
+    try:
+        entries = [entry for entry in os.scandir(ASSET_CACHE_DIR) if entry.is_file() and not entry.name.endswith(".part")]
+    except FileNotFoundError:
+        return
+    total = sum(entry.stat().st_size for entry in entries)
+    for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+        if total <= ASSET_CACHE_MAX_BYTES:
+            break
+        if entry.path == keep or entry.path in held:
+            continue
+        try:
+            size = entry.stat().st_size
+            os.remove(entry.path)
+            total -= size
+            logger.info(f"Файл {entry.name} вытеснен из кэша ({size} байт)")
+        except OSError as e:
+            logger.warning(f"Не удалось удалить {entry.path} из кэша: {e}")
+
+@contextmanager
+def local_upload_path(path: str, name: str) -> Iterator[str]:
+    """Путь к файлу кэша для локального сервера Bot API.
+
+    Сервер берёт имя документа из имени файла, поэтому на время отправки создаётся жёсткая ссылка
+    с исходным именем. Путь переводится в TELEGRAM_API_CACHE_DIR, если сервер видит кэш по другому пути.
+    """
+    upload_dir = os.path.join(ASSET_CACHE_DIR, "upload")
+    os.makedirs(upload_dir, exist_ok=True)
+    # Свой каталог на каждую отправку: ссылку не удалит параллельная отправка того же файла
+    directory = tempfile.mkdtemp(prefix=f"{os.path.basename(path)}.", dir=upload_dir)
+    link = os.path.join(directory, os.path.basename(name) or "file")
+    try:
+        os.link(path, link)
+    except OSError:
+        os.rmdir(directory)
+        raise
+    try:
+        if TELEGRAM_API_CACHE_DIR:
+            yield os.path.join(TELEGRAM_API_CACHE_DIR, os.path.relpath(link, ASSET_CACHE_DIR))
+        else:
+            yield os.path.abspath(link)
+    finally:
+        try:
+            os.remove(link)
+            os.rmdir(directory)
+        except OSError:
+            pass
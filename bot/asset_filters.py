@@ -0,0 +1,104 @@
+import fnmatch
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, List, Pattern, Tuple
+from bot.models import App
+
+# Префиксы фильтров файлов. Без префикса фильтр - шаблон имени в стиле shell (*.apk).
+EXCLUDE_PREFIX = "!"
+REGEX_PREFIX = "re:"
+ABI_PREFIX = "abi:"
+
+# Как ABI обозначаются в именах файлов. Совпадение ищется по границам слова без учёта регистра.
+ABI_ALIASES = {
+    "arm64-v8a": ("arm64-v8a", "arm64", "aarch64", "armv8"),
+    "armeabi-v7a": ("armeabi-v7a", "armeabi", "armv7", "arm32"),
+    "x86_64": ("x86_64", "x86-64", "amd64", "x64"),
+    "x86": (r"x86(?![_-]?64)", "i686", "i386"),
+    "universal": ("universal", "noarch"),
+}
+
+def _matches_any(patterns: Tuple[Pattern, ...], name: str) -> bool:
+    return any(pattern.search(name) for pattern in patterns)
+
+@dataclass(frozen=True)
+class AssetMatcher:
+    """Скомпилированные фильтры приложения.
+
+    Файл подходит, если его имя совпадает хотя бы с одним включающим фильтром (шаблоном или re:),
+    хотя бы с одним abi:, если они заданы, и ни с одним исключающим (!). Пустой кортеж - фильтров нет.
+    """
+    include: Tuple[Pattern, ...]
+    abi: Tuple[Pattern, ...]
+    exclude: Tuple[Pattern, ...]
+
+    def matches(self, name: str) -> bool:
+        if self.include and not _matches_any(self.include, name):
+            return False
+        if self.abi and not _matches_any(self.abi, name):
+            return False
+        return not (self.exclude and _matches_any(self.exclude, name))
+
+    def select(self, assets: Iterable[dict]) -> List[dict]:
+        """Возвращает подходящие файлы релиза в исходном порядке."""
+        return [asset for asset in assets if self.matches(asset['name'])]
+
+def _to_regex(pattern: str) -> str:
+    """Переводит шаблон имени или abi: (без префикса исключения) в регулярное выражение."""
+    if pattern.startswith(ABI_PREFIX):
+        abi = pattern[len(ABI_PREFIX):].strip().lower()
+        if abi not in ABI_ALIASES:
+            raise ValueError(f"Неизвестный ABI '{abi}', допустимые: {', '.join(ABI_ALIASES)}")
+        return r"(?i:(?<![a-z0-9])(?:" + "|".join(ABI_ALIASES[abi]) + r")(?![a-z0-9]))"
+    return "^" + fnmatch.translate(pattern)
+
+def _compile_user_regex(pattern: str) -> Pattern:
+    regex = pattern[len(REGEX_PREFIX):]
+    try:
+        return re.compile(regex)
+    except re.error as e:
+        raise ValueError(f"Недопустимое регулярное выражение '{regex}': {e}")
+
+class _Group:
+    """Фильтры одного вида. Шаблоны и abi: объединяются в одно выражение, а каждое re: компилируется
+    отдельно: при объединении совпали бы имена групп, сдвинулись бы номера обратных ссылок
+    и перестали бы работать флаги вроде (?x)."""
+
+    def __init__(self):
+        self.generated: List[str] = []
+        self.user: List[Pattern] = []
+
+    def add(self, pattern: str):
+        if pattern.startswith(REGEX_PREFIX):
+            self.user.append(_compile_user_regex(pattern))
+        else:
+            self.generated.append(_to_regex(pattern))
+
+    def compile(self) -> Tuple[Pattern, ...]:
+        combined = [re.compile("|".join(self.generated))] if self.generated else []
+        return tuple(combined + self.user)
+
+@lru_cache(maxsize=1024)
+def compile_filters(filters: Tuple[str, ...]) -> AssetMatcher:
+    """Компилирует фильтры в матчер. При недопустимом фильтре бросает ValueError.
+
+    Результат кэшируется по самим фильтрам, поэтому после их изменения
+    автоматически компилируется новый матчер.
+    """
+    include, abi, exclude = _Group(), _Group(), _Group()
+    for raw in filters:
+        pattern = raw.strip()
+        if not pattern:
+            continue
+        if pattern.startswith(EXCLUDE_PREFIX):
+            exclude.add(pattern[len(EXCLUDE_PREFIX):].strip())
+        elif pattern.startswith(ABI_PREFIX):
+            abi.add(pattern)
+        else:
+            include.add(pattern)
+    return AssetMatcher(include.compile(), abi.compile(), exclude.compile())
+
+def get_matcher(app: App) -> AssetMatcher:
+    """Возвращает скомпилированные фильтры приложения."""
+    return compile_filters(tuple(app.asset_filters))
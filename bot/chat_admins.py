@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import time
+from typing import Dict, FrozenSet, Tuple
+from aiogram import Bot
+from bot.config import CHAT_ADMINS_TTL
+
+logger = logging.getLogger(__name__)
+
+# Сколько групп держать в кэше, прежде чем вытеснять самые старые записи
+MAX_CHATS = 10000
+
+class ChatAdminCache:
+    """Кэш администраторов групп: один запрос getChatAdministrators на чат раз в ttl секунд.
+
+    Запись сбрасывается раньше срока при обновлениях my_chat_member и chat_member.
+    Одновременные промахи по одному чату ждут один общий запрос.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._admins: Dict[int, Tuple[float, FrozenSet[int]]] = {}
+        self._fetches: Dict[int, asyncio.Task] = {}
+        # Номер сброса записи чата: результат запроса, начатого до сброса, не сохраняется
+        self._generations: Dict[int, int] = {}
+
+    def _fetch(self, bot: Bot, chat_id: int) -> asyncio.Task:
+        task = self._fetches.get(chat_id)
+        if task is None:
+            generation = self._generations.get(chat_id, 0)
+
+            async def fetch() -> FrozenSet[int]:
+                try:
+                    members = await bot.get_chat_administrators(chat_id)
+                    admins = frozenset(member.user.id for member in members)
+                    if self._generations.get(chat_id, 0) == generation:
+                        if len(self._admins) >= MAX_CHATS:
+                            self._admins.pop(next(iter(self._admins)))
+                        self._admins[chat_id] = (time.monotonic(), admins)
+                    return admins
+                finally:
+                    if self._fetches.get(chat_id) is task:
+                        del self._fetches[chat_id]
+
+            task = self._fetches[chat_id] = asyncio.create_task(fetch())
+        return task
+
+    async def get_admins(self, bot: Bot, chat_id: int) -> FrozenSet[int]:
+        """Возвращает id администраторов чата."""
+        cached = self._admins.get(chat_id)
+        if cached and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+        # shield: отмена одного ожидающего не должна отменять общий запрос
+        return await asyncio.shield(self._fetch(bot, chat_id))
+
+    async def is_admin(self, bot: Bot, chat_id: int, user_id: int) -> bool:
+        """Проверяет, является ли пользователь администратором или создателем чата."""
+        return user_id in await self.get_admins(bot, chat_id)
+
+    def invalidate(self, chat_id: int):
+        """Сбрасывает запись чата: следующая проверка запросит администраторов заново."""
+        self._admins.pop(chat_id, None)
+        self._fetches.pop(chat_id, None)
+        self._generations[chat_id] = self._generations.get(chat_id, 0) + 1
+        if len(self._generations) > MAX_CHATS:
+            self._generations = {chat: number for chat, number in self._generations.items() if chat in self._fetches}
+
+chat_admins = ChatAdminCache(CHAT_ADMINS_TTL)
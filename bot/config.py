@@ -1,12 +1,13 @@
 import os
 from dotenv import load_dotenv
 
-# Путь к базе данных SQLite
-DB_PATH = os.path.join(os.path.dirname(__file__), "bot_data.db")
+def reload_env(override: bool = True):
+    """Перезагружает переменные окружения из .env файла.
 
-def reload_env():
-    """Перезагружает переменные окружения из .env файла."""
-    load_dotenv(override=True)
+    При старте (override=False) уже заданные переменные окружения важнее .env, чтобы запуск
+    с VAR=... (например, бенчмарк) не подменялся файлом; /reloadenv перечитывает .env поверх них.
+    """
+    load_dotenv(override=override)
     return {
         "BOT_TOKEN": os.getenv("BOT_TOKEN"),
         "ADMIN_ID": int(os.getenv("ADMIN_ID")) if os.getenv("ADMIN_ID") else None,
@@ -14,7 +15,107 @@ def reload_env():
     }
 
 # Загрузка переменных при старте
-env_vars = reload_env()
+env_vars = reload_env(override=False)
 BOT_TOKEN = env_vars["BOT_TOKEN"]
 ADMIN_ID = env_vars["ADMIN_ID"]
-GITHUB_TOKEN = env_vars["GITHUB_TOKEN"]
\ No newline at end of file
+GITHUB_TOKEN = env_vars["GITHUB_TOKEN"]
+
+# Путь к базе данных SQLite
+DB_PATH = os.getenv("DB_PATH", os.path.join(os.path.dirname(__file__), "bot_data.db"))
+
+# Адреса GitHub API (можно указать локальную заглушку для тестов)
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_GRAPHQL_URL = os.getenv("GITHUB_GRAPHQL_URL", f"{GITHUB_API_URL}/graphql")
+
+# Общий HTTP-клиент для GitHub и загрузки файлов
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "100"))
+HTTP_POOL_PER_HOST = int(os.getenv("HTTP_POOL_PER_HOST", "20"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", "300"))
+
+# Параметры проверки релизов
+# POLL_BACKEND: "rest" - запрос на каждый репозиторий, "graphql" - пакетные запросы (нужен GITHUB_TOKEN)
+POLL_BACKEND = os.getenv("POLL_BACKEND", "rest").lower()
+GRAPHQL_BATCH_SIZE = int(os.getenv("GRAPHQL_BATCH_SIZE", "50"))
+# Сколько запросов к GitHub API оставлять для интерактивных действий пользователей
+GITHUB_RATE_RESERVE = int(os.getenv("GITHUB_RATE_RESERVE", "100"))
+POLL_INTERVAL_MINUTES = int(os.getenv("POLL_INTERVAL_MINUTES", "30"))
+POLL_CONCURRENCY = int(os.getenv("POLL_CONCURRENCY", "10"))
+POLL_TIMEOUT = float(os.getenv("POLL_TIMEOUT", "30"))
+# Сколько секунд данные о последнем релизе считаются свежими для кнопки «Скачать».
+# Опрос обновляет их каждые POLL_INTERVAL_MINUTES, поэтому по умолчанию TTL вдвое больше интервала.
+RELEASE_CACHE_TTL = int(os.getenv("RELEASE_CACHE_TTL", str(POLL_INTERVAL_MINUTES * 60 * 2)))
+
+# Параметры рассылки в Telegram
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_GROUP_RATE_PER_MINUTE = float(os.getenv("TELEGRAM_GROUP_RATE_PER_MINUTE", "20"))
+DELIVERY_CONCURRENCY = int(os.getenv("DELIVERY_CONCURRENCY", "20"))
+DELIVERY_MAX_RETRIES = int(os.getenv("DELIVERY_MAX_RETRIES", "5"))
+
+# Очередь рассылки (outbox)
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+
+# Дисковый кэш файлов релизов
+ASSET_CACHE_DIR = os.getenv("ASSET_CACHE_DIR", os.path.join(os.path.dirname(__file__), "asset_cache"))
+ASSET_CACHE_MAX_BYTES = int(os.getenv("ASSET_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+ASSET_DOWNLOAD_CHUNK = int(os.getenv("ASSET_DOWNLOAD_CHUNK", str(1024 ** 2)))
+# Сколько следующих файлов релиза скачивать в кэш одновременно, пока отправляется текущий
+ASSET_PREFETCH_CONCURRENCY = max(1, int(os.getenv("ASSET_PREFETCH_CONCURRENCY", "2")))
+
+# Метрики в формате Prometheus на http://METRICS_HOST:METRICS_PORT/metrics (0 - выключены)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Получение обновлений: polling (по умолчанию) или webhook
+UPDATE_MODE = os.getenv("UPDATE_MODE", "polling").lower()
+# Публичный адрес бота для Telegram (например, https://bot.example.com) и путь webhook
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Секрет из заголовка X-Telegram-Bot-Api-Secret-Token (A-Z, a-z, 0-9, _ и -, до 256 символов)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# За обратным прокси TLS завершает прокси, а адрес клиента берётся из X-Forwarded-For.
+# Без прокси бот сам принимает HTTPS с сертификатом WEBHOOK_SSL_CERT и ключом WEBHOOK_SSL_KEY.
+WEBHOOK_BEHIND_PROXY = os.getenv("WEBHOOK_BEHIND_PROXY", "true").lower() in ("1", "true", "yes")
+WEBHOOK_SSL_CERT = os.getenv("WEBHOOK_SSL_CERT", "")
+WEBHOOK_SSL_KEY = os.getenv("WEBHOOK_SSL_KEY", "")
+# Принимать запросы только с адресов Telegram
+WEBHOOK_IP_FILTER = os.getenv("WEBHOOK_IP_FILTER", "false").lower() in ("1", "true", "yes")
+# Регистрировать webhook в Telegram при старте (из нескольких воркеров достаточно одного)
+WEBHOOK_REGISTER = os.getenv("WEBHOOK_REGISTER", "true").lower() in ("1", "true", "yes")
+
+# Выбор ведущего экземпляра: только он опрашивает GitHub и разбирает очередь рассылки.
+# LEADER_BACKEND: sqlite (аренда в файле рядом с базой), file (flock), none (один экземпляр)
+# или module:Class своего бэкенда для общего хранилища
+LEADER_BACKEND = os.getenv("LEADER_BACKEND", "sqlite")
+LEADER_LEASE_PATH = os.getenv("LEADER_LEASE_PATH", os.path.join(os.path.dirname(DB_PATH), "leader.db"))
+LEADER_LOCK_FILE = os.getenv("LEADER_LOCK_FILE", os.path.join(os.path.dirname(DB_PATH), "leader.lock"))
+LEADER_LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", "30"))
+LEADER_RENEW_SECONDS = float(os.getenv("LEADER_RENEW_SECONDS", "10"))
+# Как часто проверять изменения каталога другими экземплярами и новые строки очереди рассылки
+CATALOG_REFRESH_SECONDS = float(os.getenv("CATALOG_REFRESH_SECONDS", "5"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "30"))
+
+# Главное меню: приложений на странице, кнопок в ряду и порядок
+# (added - в порядке добавления, title - по названию, subscribers - по числу подписчиков)
+MENU_PAGE_SIZE = max(1, min(int(os.getenv("MENU_PAGE_SIZE", "10")), 90))
+MENU_COLUMNS = max(1, min(int(os.getenv("MENU_COLUMNS", "1")), 8))
+MENU_SORT = os.getenv("MENU_SORT", "added").lower()
+
+# Сервер Bot API. Пусто - api.telegram.org, который принимает файлы до 50 МБ.
+# Локальный telegram-bot-api, запущенный с --local, принимает до 2000 МБ и читает файлы прямо с диска.
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").rstrip("/")
+TELEGRAM_API_LOCAL = os.getenv("TELEGRAM_API_LOCAL", "false").lower() in ("1", "true", "yes")
+# Путь к ASSET_CACHE_DIR так, как его видит сервер Bot API (например, внутри контейнера); пусто - тот же путь
+TELEGRAM_API_CACHE_DIR = os.getenv("TELEGRAM_API_CACHE_DIR", "")
+# Файлы больше лимита не загружаются, вместо них отправляется ссылка на скачивание
+TELEGRAM_UPLOAD_LIMIT_MB = int(os.getenv("TELEGRAM_UPLOAD_LIMIT_MB", "2000" if TELEGRAM_API_LOCAL else "50"))
+TELEGRAM_UPLOAD_TIMEOUT = int(os.getenv("TELEGRAM_UPLOAD_TIMEOUT", "600"))
+
+# Сколько секунд помнить список администраторов группы (сбрасывается при смене прав участников)
+CHAT_ADMINS_TTL = float(os.getenv("CHAT_ADMINS_TTL", "300"))
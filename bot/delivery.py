@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import time
+import weakref
+from typing import Awaitable, Callable, Dict, Iterable, Optional, TypeVar
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from bot.config import (
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_GROUP_RATE_PER_MINUTE, DELIVERY_CONCURRENCY,
+    DELIVERY_MAX_RETRIES
+)
+from bot.metrics import TELEGRAM_FAILURES, TELEGRAM_RETRY_AFTER, DELIVERY_ACTIVE, add_collector
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Сколько корзин чатов держать, прежде чем удалять простаивающие
+MAX_CHAT_BUCKETS = 10000
+
+# Ответы Bad Request, после которых чат или пользователь больше не существует для бота
+NOT_FOUND_ERRORS = ("chat not found", "user not found", "peer_id_invalid", "user is deactivated")
+
+def unreachable_reason(error: Exception) -> Optional[str]:
+    """Определяет, что получатель недоступен навсегда: "forbidden" (бот заблокирован или удалён из чата),
+    "not_found" (чат или пользователь не существует). Для остальных ошибок возвращает None."""
+    if isinstance(error, TelegramForbiddenError):
+        return "forbidden"
+    if isinstance(error, TelegramBadRequest) and any(text in error.message.lower() for text in NOT_FOUND_ERRORS):
+        return "not_found"
+    return None
+
+class TokenBucket:
+    """Корзина токенов: не больше rate запросов в секунду с запасом capacity."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def is_idle(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity and time.monotonic() >= self.paused_until and not self._lock.locked()
+
+    async def acquire(self):
+        """Ждёт свободный токен. Ожидающие обслуживаются по очереди."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def consume(self):
+        """Забирает токен без ожидания (долг уменьшит скорость следующих запросов)."""
+        self._refill()
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+class DeliveryScheduler:
+    """Планировщик отправок в Telegram с учётом лимитов Bot API.
+
+    Каждый запрос забирает токен из общей корзины (TELEGRAM_GLOBAL_RATE в секунду) и из корзины
+    своего чата (TELEGRAM_CHAT_RATE в секунду для личных чатов, TELEGRAM_GROUP_RATE_PER_MINUTE в минуту
+    для групп). При TelegramRetryAfter чат ставится на паузу и запрос повторяется.
+    Одновременно выполняется не больше DELIVERY_CONCURRENCY задач рассылки.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, group_rate_per_minute: float,
+                 concurrency: int, max_retries: int):
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate_per_minute / 60
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.active = 0
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._chats = {key: value for key, value in self._chats.items() if not value.is_idle()}
+            # Отрицательные id принадлежат группам и каналам
+            bucket = TokenBucket(self.chat_rate, 1) if chat_id > 0 else TokenBucket(self.group_rate, 3)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def call(self, chat_id: int, request: Callable[[], Awaitable[T]], interactive: bool = False) -> T:
+        """Выполняет запрос к Bot API для чата с соблюдением лимитов и повтором после RetryAfter.
+
+        request вызывается заново при каждой попытке. Интерактивные запросы (ответы на нажатия кнопок)
+        не ждут очереди общей корзины, но расходуют её токены.
+        """
+        bucket = self._chat_bucket(chat_id)
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            if interactive:
+                self._global.consume()
+            else:
+                await self._global.acquire()
+            try:
+                return await request()
+            except TelegramRetryAfter as e:
+                TELEGRAM_RETRY_AFTER.inc()
+                if attempt == self.max_retries:
+                    TELEGRAM_FAILURES.inc(error=type(e).__name__)
+                    raise
+                logger.warning(f"Telegram ограничил отправку в чат {chat_id}, повтор через {e.retry_after} с")
+                bucket.pause(e.retry_after)
+            except Exception as e:
+                TELEGRAM_FAILURES.inc(error=type(e).__name__)
+                raise
+
+    async def run(self, jobs: Iterable[Awaitable]) -> list:
+        """Выполняет задачи рассылки, не более DELIVERY_CONCURRENCY одновременно."""
+        async def bounded(job):
+            try:
+                async with self._semaphore:
+                    self.active += 1
+                    try:
+                        return await job
+                    finally:
+                        self.active -= 1
+            finally:
+                # Задача, отменённая до запуска, закрывается без предупреждения "never awaited"
+                job.close()
+        return await asyncio.gather(*(bounded(job) for job in jobs), return_exceptions=True)
+
+delivery = DeliveryScheduler(
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_GROUP_RATE_PER_MINUTE, DELIVERY_CONCURRENCY,
+    DELIVERY_MAX_RETRIES
+)
+
+def _collect_active():
+    DELIVERY_ACTIVE.set(delivery.active)
+
+add_collector(_collect_active)
+
+# Блокировки загрузки файлов: пока один получатель загружает файл, остальные ждут его file_id
+_upload_locks: "weakref.WeakValueDictionary[tuple, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+def upload_lock(key: tuple) -> asyncio.Lock:
+    lock = _upload_locks.get(key)
+    if lock is None:
+        lock = asyncio.Lock()
+        _upload_locks[key] = lock
+    return lock
@@ -0,0 +1,85 @@
+import logging
+import time
+from typing import Dict, List, Optional
+from bot import config
+from bot.config import GITHUB_GRAPHQL_URL
+from bot.github_ratelimit import github_limiter, PRIORITY_POLL
+from bot.http_client import get_http_session
+from bot.metrics import GITHUB_REQUEST_SECONDS, GITHUB_RESPONSES
+
+logger = logging.getLogger(__name__)
+
+RELEASE_FIELDS = """
+    latestRelease {
+        tagName
+        name
+        description
+        releaseAssets(first: 100) {
+            nodes { name size downloadUrl }
+        }
+    }
+"""
+
+def build_query(repos: List[str]) -> tuple:
+    """Строит GraphQL-запрос последних релизов для нескольких репозиториев и его переменные."""
+    params, fields, variables = [], [], {}
+    for i, repo in enumerate(repos):
+        owner, name = repo.split("/", 1)
+        params.append(f"$o{i}: String!, $n{i}: String!")
+        fields.append(f"r{i}: repository(owner: $o{i}, name: $n{i}) {{{RELEASE_FIELDS}}}")
+        variables[f"o{i}"] = owner
+        variables[f"n{i}"] = name
+    query = f"query({', '.join(params)}) {{\n" + "\n".join(fields) + "\n}"
+    return query, variables
+
+def to_rest_release(node: Optional[dict]) -> Optional[dict]:
+    """Приводит latestRelease из GraphQL к формату ответа REST /releases/latest."""
+    if not node or not node.get("latestRelease"):
+        return None
+    release = node["latestRelease"]
+    return {
+        "tag_name": release["tagName"],
+        "name": release["name"],
+        "body": release["description"],
+        "assets": [
+            {"name": asset["name"], "size": asset["size"], "browser_download_url": asset["downloadUrl"]}
+            for asset in release["releaseAssets"]["nodes"]
+        ]
+    }
+
+async def get_latest_releases_batch(repos: List[str]) -> Optional[Dict[str, Optional[dict]]]:
+    """Запрашивает последние релизы пачки репозиториев одним GraphQL-запросом.
+
+    Возвращает {repo: релиз или None}. Если запрос целиком не удался, возвращает None,
+    чтобы вызывающий код мог повторить эти репозитории через REST.
+    """
+    query, variables = build_query(repos)
+    headers = {"Authorization": f"bearer {config.GITHUB_TOKEN}"}
+    if not github_limiter.acquire("graphql", PRIORITY_POLL):
+        logger.warning(f"GraphQL-запрос для {len(repos)} репозиториев отложен: лимит GitHub API почти исчерпан")
+        GITHUB_RESPONSES.inc(endpoint="graphql", status="deferred")
+        return {repo: None for repo in repos}
+    started = time.perf_counter()
+    try:
+        async with get_http_session().post(GITHUB_GRAPHQL_URL, json={"query": query, "variables": variables}, headers=headers) as resp:
+            body = await resp.text() if resp.status in (403, 429) else ""
+            github_limiter.update("graphql", resp.status, resp.headers, body)
+            GITHUB_RESPONSES.inc(endpoint="graphql", status=resp.status)
+            if resp.status != 200:
+                logger.error(f"Ошибка GraphQL-запроса для {len(repos)} репозиториев: HTTP {resp.status}")
+                return None
+            payload = await resp.json()
+    except Exception as e:
+        logger.error(f"Ошибка GraphQL-запроса для {len(repos)} репозиториев: {e}")
+        GITHUB_RESPONSES.inc(endpoint="graphql", status="error")
+        return None
+    finally:
+        GITHUB_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint="graphql")
+        github_limiter.release("graphql")
+    data = payload.get("data")
+    if not data:
+        logger.error(f"GraphQL вернул ошибки без данных: {payload.get('errors')}")
+        return None
+    for error in payload.get("errors", []):
+        logger.warning(f"Ошибка GraphQL для {error.get('path')}: {error.get('message')}")
+    return {repo: to_rest_release(data.get(f"r{i}")) for i, repo in enumerate(repos)}
@@ -0,0 +1,134 @@
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, Mapping, Optional
+from bot.config import GITHUB_RATE_RESERVE
+from bot.metrics import GITHUB_RATELIMIT_REMAINING, GITHUB_IN_FLIGHT, add_collector
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты запросов к GitHub: интерактивные (нажатия кнопок, команды) и фоновый опрос
+PRIORITY_INTERACTIVE = 0
+PRIORITY_POLL = 1
+
+# Сколько ждать после вторичного лимита, если GitHub не прислал Retry-After
+SECONDARY_LIMIT_PAUSE = 60
+
+def is_secondary_limit(body: str) -> bool:
+    """Проверяет по тексту ответа 403/429, что это вторичный лимит GitHub, а не запрет доступа к репозиторию."""
+    text = body.lower()
+    return "secondary rate limit" in text or "abuse" in text
+
+@dataclass
+class RateLimitState:
+    """Состояние лимита одного ресурса GitHub API (core, graphql)."""
+    limit: Optional[int] = None
+    remaining: Optional[int] = None
+    reset_at: float = 0.0
+    blocked_until: float = 0.0
+    in_flight: int = 0
+    poll_floor: int = 0
+
+class GitHubRateLimiter:
+    """Следит за лимитами GitHub API по заголовкам ответов и решает, можно ли отправить запрос.
+
+    Фоновый опрос откладывается, когда остаток запросов опускается до резерва GITHUB_RATE_RESERVE
+    (или до порога, рассчитанного на текущий цикл опроса), а интерактивные запросы могут расходовать
+    и резерв. После 403/429 с Retry-After, исчерпанным лимитом или сообщением о вторичном лимите
+    запросы не отправляются до сброса. Остальные 403 (закрытый репозиторий, SAML) лимит не затрагивают.
+    """
+
+    def __init__(self, reserve: int):
+        self.reserve = reserve
+        self._states: Dict[str, RateLimitState] = {}
+
+    def state(self, resource: str) -> RateLimitState:
+        return self._states.setdefault(resource, RateLimitState())
+
+    def available(self, resource: str) -> Optional[int]:
+        """Возвращает оценку оставшихся запросов с учётом выполняющихся или None, если лимит неизвестен."""
+        state = self.state(resource)
+        if state.remaining is None or time.time() >= state.reset_at:
+            return None
+        return state.remaining - state.in_flight
+
+    def acquire(self, resource: str, priority: int) -> bool:
+        """Резервирует запрос. Возвращает False, если его нужно отложить."""
+        state = self.state(resource)
+        if time.time() < state.blocked_until:
+            return False
+        available = self.available(resource)
+        if available is not None:
+            floor = max(self.reserve, state.poll_floor) if priority == PRIORITY_POLL else 0
+            if available <= floor:
+                return False
+        state.in_flight += 1
+        return True
+
+    def release(self, resource: str):
+        state = self.state(resource)
+        state.in_flight = max(0, state.in_flight - 1)
+
+    def update(self, resource: str, status: int, headers: Mapping[str, str], body: str = "") -> bool:
+        """Обновляет состояние по заголовкам X-RateLimit-* и Retry-After ответа GitHub.
+
+        body - текст ответа 403/429. Возвращает True, если ответ означает превышение лимита.
+        """
+        resource = headers.get("X-RateLimit-Resource", resource)
+        state = self.state(resource)
+        now = time.time()
+        try:
+            if "X-RateLimit-Limit" in headers:
+                state.limit = int(headers["X-RateLimit-Limit"])
+            if "X-RateLimit-Remaining" in headers:
+                state.remaining = int(headers["X-RateLimit-Remaining"])
+                GITHUB_RATELIMIT_REMAINING.set(state.remaining, resource=resource)
+            if "X-RateLimit-Reset" in headers:
+                state.reset_at = float(headers["X-RateLimit-Reset"])
+            retry_after = int(headers["Retry-After"]) if "Retry-After" in headers else None
+        except ValueError:
+            logger.warning(f"Некорректные заголовки лимита GitHub: {dict(headers)}")
+            return False
+        if status not in (403, 429):
+            return False
+        if retry_after is not None:
+            state.blocked_until = now + retry_after
+        elif state.remaining == 0:
+            state.blocked_until = state.reset_at
+        elif is_secondary_limit(body):
+            state.blocked_until = now + SECONDARY_LIMIT_PAUSE
+        else:
+            return False
+        logger.warning(
+            f"GitHub API ({resource}) ограничил запросы до "
+            f"{time.strftime('%H:%M:%S', time.localtime(state.blocked_until))}"
+        )
+        return True
+
+    def begin_cycle(self, interval: float):
+        """Распределяет остаток лимита между циклами опроса до его сброса.
+
+        Если до сброса пройдёт несколько циклов, текущий может израсходовать только свою долю,
+        чтобы последующие циклы и интерактивные запросы не остались без лимита.
+        """
+        now = time.time()
+        for resource, state in self._states.items():
+            if state.remaining is None or now >= state.reset_at:
+                state.poll_floor = 0
+                continue
+            cycles = max(1, math.ceil((state.reset_at - now) / interval))
+            spendable = max(0, state.remaining - self.reserve)
+            state.poll_floor = self.reserve + spendable * (cycles - 1) // cycles
+            logger.info(
+                f"Лимит GitHub API ({resource}): осталось {state.remaining}, "
+                f"циклов до сброса {cycles}, опрос до порога {state.poll_floor}"
+            )
+
+github_limiter = GitHubRateLimiter(GITHUB_RATE_RESERVE)
+
+def _collect_in_flight():
+    for resource, state in github_limiter._states.items():
+        GITHUB_IN_FLIGHT.set(state.in_flight, resource=resource)
+
+add_collector(_collect_in_flight)
@@ -1,22 +1,63 @@
 from aiogram import Router, F, Bot
-from aiogram.types import Message, CallbackQuery, BufferedInputFile
-from aiogram.filters import Command, CommandStart
+from aiogram.types import (
+    Message, CallbackQuery, InlineQuery, InlineQueryResultArticle, InputTextMessageContent, ChatMemberUpdated
+)
+from aiogram.filters import Command, CommandStart, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from bot.storage import get_all_apps, get_app, save_app, delete_app
+from bot.storage import (
+    get_all_apps, get_app, save_app, delete_app, subscribe, toggle_subscriber, get_subscriber_counts,
+    get_subscribed_apps, catalog_revision, apps_revision, get_pruned_recipients, KIND_USER, KIND_CHAT
+)
 from bot.models import App
-from bot.config import ADMIN_ID, GITHUB_TOKEN, reload_env
-from bot.services import get_latest_release, get_release_assets, check_releases
-from bot.utils import validate_repo, validate_key
+from bot import config
+from bot.config import MENU_PAGE_SIZE, MENU_COLUMNS, MENU_SORT, reload_env
+from bot.services import (
+    get_latest_release, get_cached_release, get_release_assets, check_releases, prefetch_assets, asset_groups,
+    send_assets, prune_unreachable, migrate_chat
+)
+from bot.utils import validate_repo, validate_key, validate_asset_filters
+from bot.asset_filters import get_matcher
+from bot.search import app_index
+from bot.chat_admins import chat_admins
+from bot.asset_cache import hold_assets
+from bot.metrics import (
+    HANDLER_SECONDS, GITHUB_REQUEST_SECONDS, GITHUB_RESPONSES, GITHUB_RATELIMIT_REMAINING, POLL_SWEEP_SECONDS,
+    POLL_LAST_SWEEP, RELEASES_DETECTED, ASSET_FETCHES, ASSET_DOWNLOAD_BYTES, SEND_DOCUMENT_SECONDS,
+    TELEGRAM_FAILURES, TELEGRAM_RETRY_AFTER, RECIPIENTS_PRUNED, OUTBOX_PENDING, DELIVERY_ACTIVE, STARTED_AT, collect
+)
 import logging
-import aiohttp
-import fnmatch
+import time
+from typing import Dict, List, Optional
 
 logger = logging.getLogger(__name__)
 
 router = Router()
 
+# Результатов inline-поиска на страницу (не больше 50) и время их кэширования в Telegram
+INLINE_PAGE_SIZE = 50
+INLINE_CACHE_SECONDS = 60
+
+# Сколько последних записей показывает /pruned
+PRUNED_REPORT_SIZE = 30
+
+# Префиксы callback_data, для которых ведётся метрика длительности (остальные попадают в other)
+CALLBACK_PREFIXES = {
+    "app", "back", "menu", "noop", "download", "link", "subscribe", "setrepo", "delete", "asset", "asset_done"
+}
+
+@router.callback_query.outer_middleware()
+async def measure_callback(handler, event: CallbackQuery, data: dict):
+    prefix = (event.data or "").split(":", 1)[0]
+    with HANDLER_SECONDS.time(prefix=prefix if prefix in CALLBACK_PREFIXES else "other"):
+        return await handler(event, data)
+
+FILTERS_HELP = (
+    "Фильтр - шаблон имени (*.apk), регулярное выражение (re:^app-.*\\.apk$) или ABI (abi:arm64-v8a); "
+    "! в начале исключает подходящие файлы (!*debug*)."
+)
+
 class AddAppStates(StatesGroup):
     key = State()
     title = State()
@@ -25,9 +66,58 @@ class AddAppStates(StatesGroup):
     asset_filters = State()
     select_assets = State()
 
-def get_main_menu(apps):
-    buttons = [[InlineKeyboardButton(text=app.title, callback_data=f"app:{app.key}")] for app in apps]
-    return InlineKeyboardMarkup(inline_keyboard=buttons)
+# Готовые страницы главного меню и номер страницы каждого приложения.
+# Перестраиваются, только когда меняется каталог (catalog_revision).
+_menu_revision = None
+_menu_pages: List[InlineKeyboardMarkup] = []
+_menu_page_of: Dict[str, int] = {}
+
+def _sorted_apps(apps: List[App]) -> List[App]:
+    if MENU_SORT == "title":
+        return sorted(apps, key=lambda app: app.title.casefold())
+    if MENU_SORT == "subscribers":
+        return sorted(apps, key=lambda app: len(app.subscribers_users) + len(app.subscribers_chats), reverse=True)
+    return apps
+
+def _build_menu_pages():
+    global _menu_pages, _menu_page_of
+    apps = _sorted_apps(get_all_apps())
+    chunks = [apps[i:i + MENU_PAGE_SIZE] for i in range(0, len(apps), MENU_PAGE_SIZE)]
+    pages, page_of = [], {}
+    for number, chunk in enumerate(chunks):
+        app_buttons = [InlineKeyboardButton(text=app.title, callback_data=f"app:{app.key}") for app in chunk]
+        buttons = [app_buttons[i:i + MENU_COLUMNS] for i in range(0, len(app_buttons), MENU_COLUMNS)]
+        if len(chunks) > 1:
+            navigation = []
+            if number > 0:
+                navigation.append(InlineKeyboardButton(text="◀️", callback_data=f"menu:{number - 1}"))
+            navigation.append(InlineKeyboardButton(text=f"{number + 1}/{len(chunks)}", callback_data="noop"))
+            if number < len(chunks) - 1:
+                navigation.append(InlineKeyboardButton(text="▶️", callback_data=f"menu:{number + 1}"))
+            buttons.append(navigation)
+        pages.append(InlineKeyboardMarkup(inline_keyboard=buttons))
+        page_of.update((app.key, number) for app in chunk)
+    _menu_pages, _menu_page_of = pages, page_of
+
+def _ensure_menu_pages():
+    global _menu_revision
+    # Порядок по подписчикам зависит и от подписок, остальные - только от самих приложений
+    revision = catalog_revision() if MENU_SORT == "subscribers" else apps_revision()
+    if revision != _menu_revision:
+        _build_menu_pages()
+        _menu_revision = revision
+
+def get_main_menu(page: int = 0) -> Optional[InlineKeyboardMarkup]:
+    """Возвращает страницу главного меню (None, если приложений нет)."""
+    _ensure_menu_pages()
+    if not _menu_pages:
+        return None
+    return _menu_pages[max(0, min(page, len(_menu_pages) - 1))]
+
+def get_menu_page(key: str) -> int:
+    """Возвращает номер страницы меню, на которой находится приложение."""
+    _ensure_menu_pages()
+    return _menu_page_of.get(key, 0)
 
 def get_app_menu(app: App, is_subscribed: bool, is_admin: bool = False):
     buttons = [
@@ -38,7 +128,7 @@ def get_app_menu(app: App, is_subscribed: bool, is_admin: bool = False):
     if is_admin:
         buttons.append([InlineKeyboardButton(text="🗑️ Удалить", callback_data=f"delete:{app.key}")])
         buttons.append([InlineKeyboardButton(text="🔄 Установить репозиторий", callback_data=f"setrepo:{app.key}")])
-    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back")])
+    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=f"back:{app.key}")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 def get_asset_selection_menu(assets: list, selected: list):
@@ -51,10 +141,67 @@ def get_asset_selection_menu(assets: list, selected: list):
     buttons.append([InlineKeyboardButton(text="✅ Готово", callback_data="asset_done")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+def deep_link(bot_username: str, action: str, key: str) -> str:
+    """Ссылка, открывающая личный чат с ботом с командой /start <action>_<key>."""
+    return f"https://t.me/{bot_username}?start={action}_{key}"
+
+async def send_app_files(bot: Bot, chat_id: int, app: App, release: dict, reply_markup: InlineKeyboardMarkup):
+    """Отправляет в чат файлы релиза, подходящие под фильтры приложения, а затем меню приложения."""
+    await bot.send_message(chat_id, "Отправка файлов...")
+    sent = False
+    caption = f"{app.title}: {release['name']}\n{release.get('body', 'Описание релиза отсутствует.')}"
+    assets = get_matcher(app).select(release['assets'])
+    with hold_assets(app.repo, release['tag_name'], assets):
+        await prefetch_assets(app.repo, release['tag_name'], assets[1:])
+        for group in asset_groups(assets, app.album):
+            names = ", ".join(asset['name'] for asset in group)
+            try:
+                if await send_assets(bot, chat_id, app.repo, release['tag_name'], group,
+                                     caption if not sent else None, interactive=True):
+                    sent = True
+                    logger.info(f"Отправлено: {names} для {app.title} в чат {chat_id}")
+            except Exception as e:
+                logger.error(f"Ошибка при загрузке файлов {names}: {e}")
+                continue
+    if not sent:
+        await bot.send_message(chat_id, "Подходящие файлы для скачивания не найдены или недоступны.")
+    else:
+        await bot.send_message(chat_id, f"{app.title} (файлы успешно отправлены)", reply_markup=reply_markup)
+
+async def open_deep_link(message: Message, bot: Bot, payload: str):
+    """Выполняет действие из ссылки результата inline-поиска: app_, download_ или subscribe_<ключ>."""
+    action, _, key = payload.partition("_")
+    app = get_app(key)
+    if action not in ("app", "download", "subscribe") or not app:
+        await message.answer("Приложение не найдено.", reply_markup=get_main_menu())
+        return
+    user_id = message.from_user.id
+    is_admin = user_id == config.ADMIN_ID
+    if action == "subscribe":
+        await subscribe(app.key, user_id, KIND_USER)
+        await message.answer(f"Вы подписались на {app.title}", reply_markup=get_app_menu(app, True, is_admin))
+        logger.info(f"Пользователь {user_id} подписался на {app.title} по ссылке")
+        return
+    menu = get_app_menu(app, user_id in app.subscribers_users, is_admin)
+    if action == "app":
+        await message.answer(app.title, reply_markup=menu)
+        return
+    release = await get_cached_release(app.repo)
+    if not release:
+        await message.answer("Релизы для этого приложения не найдены.")
+        return
+    if not app.asset_filters:
+        await message.answer("Фильтры для файлов не указаны. Обновите через /setfilters.")
+        return
+    await send_app_files(bot, message.chat.id, app, release, menu)
+
 @router.message(CommandStart())
-async def start(message: Message):
+async def start(message: Message, command: CommandObject, bot: Bot):
     try:
-        apps = get_all_apps()
+        if command.args and message.chat.type == "private":
+            await open_deep_link(message, bot, command.args)
+            return
+        main_menu = get_main_menu()
         welcome_text = (
             "Добро пожаловать! Это бот для отслеживания релизов приложений на GitHub.\n\n"
             "Доступные команды:\n"
@@ -62,10 +209,10 @@ async def start(message: Message):
             "/menu - Открыть меню приложений\n"
             "/help - Показать справку по командам"
         )
-        if not apps:
+        if not main_menu:
             await message.answer(f"{welcome_text}\n\nПока нет доступных приложений.")
             return
-        await message.answer(f"{welcome_text}\n\nВыберите приложение:", reply_markup=get_main_menu(apps))
+        await message.answer(f"{welcome_text}\n\nВыберите приложение:", reply_markup=main_menu)
         logger.info(f"Пользователь {message.from_user.id} запустил бот")
     except Exception as e:
         logger.error(f"Ошибка в команде start: {e}")
@@ -74,11 +221,11 @@ async def start(message: Message):
 @router.message(Command("menu"))
 async def menu(message: Message):
     try:
-        apps = get_all_apps()
-        if not apps:
+        main_menu = get_main_menu()
+        if not main_menu:
             await message.answer("Пока нет доступных приложений.")
             return
-        await message.answer("Выберите приложение:", reply_markup=get_main_menu(apps))
+        await message.answer("Выберите приложение:", reply_markup=main_menu)
         logger.info(f"Пользователь {message.from_user.id} открыл меню")
     except Exception as e:
         logger.error(f"Ошибка в команде menu: {e}")
@@ -91,7 +238,8 @@ async def help_command(message: Message):
             "📋 **Команды для всех пользователей**:\n"
             "/start - Запустить бот и показать приветственное сообщение\n"
             "/menu - Показать меню приложений\n"
-            "/help - Показать эту справку"
+            "/help - Показать эту справку\n\n"
+            "🔍 Поиск: наберите в любом чате имя бота и название, ключ или репозиторий приложения"
         )
         await message.answer(help_text, parse_mode="Markdown")
         logger.info(f"Пользователь {message.from_user.id} запросил справку")
@@ -107,8 +255,13 @@ async def admin_help_command(message: Message):
             "/addapp - Начать добавление нового приложения\n"
             "/removeapp <key> - Удалить приложение по ключу\n"
             "/setrepo <key> <owner/repo> - Установить GitHub-репозиторий для приложения\n"
+            "/setfilters <key> <фильтры> - Установить фильтры файлов для приложения\n"
+            "/setalbum <key> on|off - Отправлять файлы приложения альбомом\n"
             "/apps - Показать список всех приложений\n"
+            "/userapps <id> - Показать подписки пользователя или чата\n"
             "/checkupdates - Ручная проверка обновлений\n"
+            "/stats - Статистика работы бота\n"
+            "/pruned - Недоступные получатели, удалённые из рассылки\n"
             "/reloadenv - Перезагрузить переменные окружения из .env"
         )
         await message.answer(help_text, parse_mode="Markdown")
@@ -119,15 +272,15 @@ async def admin_help_command(message: Message):
 
 @router.message(Command("reloadenv"))
 async def reload_env_command(message: Message):
-    global GITHUB_TOKEN, ADMIN_ID, BOT_TOKEN
-    if message.from_user.id != ADMIN_ID:
+    if message.from_user.id != config.ADMIN_ID:
         await message.answer("Эта команда доступна только глобальному администратору.")
         return
     try:
+        # Значения меняются в bot.config: остальные модули читают их оттуда при каждом запросе
         env_vars = reload_env()
-        BOT_TOKEN = env_vars["BOT_TOKEN"]
-        ADMIN_ID = env_vars["ADMIN_ID"]
-        GITHUB_TOKEN = env_vars["GITHUB_TOKEN"]
+        config.BOT_TOKEN = env_vars["BOT_TOKEN"]
+        config.ADMIN_ID = env_vars["ADMIN_ID"]
+        config.GITHUB_TOKEN = env_vars["GITHUB_TOKEN"]
         await message.answer("Переменные окружения успешно перезагружены!")
         logger.info(f"Админ {message.from_user.id} перезагрузил переменные окружения")
     except Exception as e:
@@ -136,7 +289,7 @@ async def reload_env_command(message: Message):
 
 @router.message(Command("addapp"))
 async def add_app(message: Message, state: FSMContext):
-    if message.from_user.id != ADMIN_ID:
+    if message.from_user.id != config.ADMIN_ID:
         await message.answer("Только глобальный администратор может добавлять приложения.")
         return
     await message.answer("Введите ключ приложения (уникальный идентификатор, например, 'lsposed'):")
@@ -192,7 +345,7 @@ async def process_repo(message: Message, state: FSMContext):
     await state.update_data(repo=repo)
     assets = await get_release_assets(repo)
     if not assets:
-        await message.answer("В последнем релизе нет активов. Введите фильтры для файлов вручную (через запятую, например, 'LSPosed-*-riru-release.zip,LSPosed-*-zygisk-release.zip'):")
+        await message.answer("В последнем релизе нет активов. Введите фильтры для файлов вручную (через запятую, например, 'LSPosed-*-riru-release.zip,LSPosed-*-zygisk-release.zip').\n" + FILTERS_HELP)
         await state.set_state(AddAppStates.asset_filters)
     else:
         await state.update_data(available_assets=assets, selected_asset_indices=[])
@@ -228,7 +381,7 @@ async def finish_assets(callback: CallbackQuery, state: FSMContext):
         assets = data.get("available_assets", [])
         selected_indices = data.get("selected_asset_indices", [])
         if not selected_indices:
-            await callback.message.edit_text("Файлы не выбраны. Введите фильтры для файлов вручную (через запятую, например, 'LSPosed-*-riru-release.zip,LSPosed-*-zygisk-release.zip'):")
+            await callback.message.edit_text("Файлы не выбраны. Введите фильтры для файлов вручную (через запятую, например, 'LSPosed-*-riru-release.zip,LSPosed-*-zygisk-release.zip').\n" + FILTERS_HELP)
             await state.set_state(AddAppStates.asset_filters)
             return
         selected_assets = [assets[i] for i in selected_indices]
@@ -250,10 +403,10 @@ async def finish_assets(callback: CallbackQuery, state: FSMContext):
             subscribers_chats=[],
             latest_release=None
         )
-        save_app(app)
+        await save_app(app)
+        app_index.sync()
         await callback.message.edit_text(f"Приложение {app.title} успешно добавлено!")
-        apps = get_all_apps()
-        await callback.message.bot.send_message(callback.message.chat.id, "Главное меню:", reply_markup=get_main_menu(apps))
+        await callback.message.bot.send_message(callback.message.chat.id, "Главное меню:", reply_markup=get_main_menu())
         await state.clear()
         logger.info(f"Админ {callback.from_user.id} добавил приложение: {app.key}")
     except KeyError as e:
@@ -269,6 +422,9 @@ async def process_filters(message: Message, state: FSMContext):
     if not filters:
         await message.answer("Требуется хотя бы один фильтр.")
         return
+    if not validate_asset_filters(filters):
+        await message.answer(f"Недопустимые фильтры. {FILTERS_HELP}")
+        return
     data = await state.get_data()
     required_keys = ["key", "title", "link", "repo"]
     if not all(key in data for key in required_keys):
@@ -286,16 +442,16 @@ async def process_filters(message: Message, state: FSMContext):
         subscribers_chats=[],
         latest_release=None
     )
-    save_app(app)
+    await save_app(app)
+    app_index.sync()
     await message.answer(f"Приложение {app.title} успешно добавлено!")
-    apps = get_all_apps()
-    await message.answer("Главное меню:", reply_markup=get_main_menu(apps))
+    await message.answer("Главное меню:", reply_markup=get_main_menu())
     await state.clear()
     logger.info(f"Админ {message.from_user.id} добавил приложение: {app.key}")
 
 @router.message(Command("removeapp"))
 async def remove_app(message: Message):
-    if message.from_user.id != ADMIN_ID:
+    if message.from_user.id != config.ADMIN_ID:
         await message.answer("Только глобальный администратор может удалять приложения.")
         return
     args = message.text.split(maxsplit=1)
@@ -304,17 +460,17 @@ async def remove_app(message: Message):
         return
     key = args[1].strip()
     if get_app(key):
-        delete_app(key)
+        await delete_app(key)
+        app_index.sync()
         await message.answer(f"Приложение {key} удалено!")
-        apps = get_all_apps()
-        await message.answer("Главное меню:", reply_markup=get_main_menu(apps))
+        await message.answer("Главное меню:", reply_markup=get_main_menu())
         logger.info(f"Админ {message.from_user.id} удалил приложение: {key}")
     else:
         await message.answer("Приложение не найдено.")
 
 @router.message(Command("setrepo"))
 async def set_repo(message: Message):
-    if message.from_user.id != ADMIN_ID:
+    if message.from_user.id != config.ADMIN_ID:
         await message.answer("Только глобальный администратор может устанавливать репозитории.")
         return
     args = message.text.split(maxsplit=2)
@@ -335,29 +491,160 @@ async def set_repo(message: Message):
         return
     app.repo = repo
     app.asset_filters = []  # Сбрасываем фильтры
-    save_app(app)
-    await message.answer(f"Репозиторий для {key} обновлён на {repo}! Введите новые фильтры для файлов (через запятую, например, 'LSPosed-*-riru-release.zip,LSPosed-*-zygisk-release.zip'):")
+    await save_app(app)
+    await message.answer(f"Репозиторий для {key} обновлён на {repo}! Задайте новые фильтры: /setfilters {key} <фильтры>")
     logger.info(f"Админ {message.from_user.id} установил репозиторий для {key}: {repo}")
 
+@router.message(Command("setfilters"))
+async def set_filters(message: Message):
+    if message.from_user.id != config.ADMIN_ID:
+        await message.answer("Только глобальный администратор может устанавливать фильтры.")
+        return
+    args = message.text.split(maxsplit=2)
+    if len(args) != 3:
+        await message.answer(f"Использование: /setfilters <ключ> <фильтры через запятую>\n{FILTERS_HELP}")
+        return
+    key = args[1].strip()
+    filters = [f.strip() for f in args[2].split(",") if f.strip()]
+    app = get_app(key)
+    if not app:
+        await message.answer("Приложение не найдено.")
+        return
+    if not filters or not validate_asset_filters(filters):
+        await message.answer(f"Недопустимые фильтры. {FILTERS_HELP}")
+        return
+    app.asset_filters = filters
+    await save_app(app)
+    await message.answer(f"Фильтры для {key} обновлены: {', '.join(filters)}")
+    logger.info(f"Админ {message.from_user.id} установил фильтры для {key}: {filters}")
+
+@router.message(Command("setalbum"))
+async def set_album(message: Message):
+    if message.from_user.id != config.ADMIN_ID:
+        await message.answer("Только глобальный администратор может менять режим отправки.")
+        return
+    args = message.text.split()
+    if len(args) != 3 or args[2].lower() not in ("on", "off"):
+        await message.answer("Использование: /setalbum <ключ> on|off")
+        return
+    key = args[1]
+    app = get_app(key)
+    if not app:
+        await message.answer("Приложение не найдено.")
+        return
+    app.album = args[2].lower() == "on"
+    await save_app(app)
+    await message.answer(
+        f"Файлы {key} будут отправляться альбомом (до 10 в сообщении)" if app.album
+        else f"Файлы {key} будут отправляться по одному"
+    )
+    logger.info(f"Админ {message.from_user.id} {'включил' if app.album else 'выключил'} альбомы для {key}")
+
 @router.message(Command("apps"))
 async def list_apps(message: Message):
-    if message.from_user.id != ADMIN_ID:
+    if message.from_user.id != config.ADMIN_ID:
         await message.answer("Только глобальный администратор может просматривать список приложений.")
         return
     apps = get_all_apps()
     if not apps:
         await message.answer("Нет доступных приложений.")
         return
+    counts = get_subscriber_counts()
     text = "Приложения:\n" + "\n".join(
-        f"{app.title} ({app.key})\n  Репозиторий: {app.repo}\n  Подписчики: {len(app.subscribers_users)} пользователей, {len(app.subscribers_chats)} чатов\n  Фильтры: {', '.join(app.asset_filters) if app.asset_filters else 'Не указаны'}"
+        f"{app.title} ({app.key})\n  Репозиторий: {app.repo}\n  Подписчики: {counts.get(app.key, (0, 0))[0]} пользователей, {counts.get(app.key, (0, 0))[1]} чатов\n  Фильтры: {', '.join(app.asset_filters) if app.asset_filters else 'Не указаны'}"
         for app in apps
     )
     await message.answer(text)
     logger.info(f"Админ {message.from_user.id} запросил список приложений")
 
+@router.message(Command("userapps"))
+async def user_apps(message: Message):
+    if message.from_user.id != config.ADMIN_ID:
+        await message.answer("Только глобальный администратор может просматривать подписки.")
+        return
+    args = message.text.split(maxsplit=1)
+    if len(args) != 2 or not args[1].strip().lstrip("-").isdigit():
+        await message.answer("Использование: /userapps <id пользователя или чата>")
+        return
+    chat_id = int(args[1].strip())
+    kind = KIND_USER if chat_id > 0 else KIND_CHAT
+    keys = await get_subscribed_apps(chat_id, kind)
+    if not keys:
+        await message.answer(f"{chat_id} не подписан ни на одно приложение.")
+        return
+    await message.answer(f"Подписки {chat_id}:\n" + "\n".join(keys))
+    logger.info(f"Админ {message.from_user.id} запросил подписки {chat_id}")
+
+def _average(histogram, **labels) -> str:
+    count, total = histogram.totals(**labels)
+    p95 = histogram.quantile(0.95, **labels)
+    return f"{count} шт., среднее {total / count:.2f} с, p95 ≤ {p95} с" if count else "0 шт."
+
+async def stats_text() -> str:
+    """Собирает сводку метрик для команды /stats."""
+    await collect()
+    uptime = int(time.time() - STARTED_AT)
+    apps = get_all_apps()
+    counts = get_subscriber_counts()
+    last_sweep = POLL_LAST_SWEEP.value()
+    statuses = GITHUB_RESPONSES.by("status")
+    limits = ", ".join(
+        f"{resource}: {int(GITHUB_RATELIMIT_REMAINING.value(resource=resource))}"
+        for resource in ("core", "graphql") if GITHUB_RATELIMIT_REMAINING.value(resource=resource) is not None
+    )
+    failures = TELEGRAM_FAILURES.by("error")
+    pruned = RECIPIENTS_PRUNED.by("reason")
+    return "\n".join([
+        "📊 Статистика",
+        f"Работает: {uptime // 3600} ч {uptime % 3600 // 60} мин",
+        f"Приложений: {len(apps)}, подписок: {sum(u for u, _ in counts.values())} пользователей, "
+        f"{sum(c for _, c in counts.values())} чатов",
+        f"Проверки релизов: {_average(POLL_SWEEP_SECONDS)}"
+        + (f", последняя {int(time.time() - last_sweep) // 60} мин назад" if last_sweep else ""),
+        f"Найдено релизов: {int(RELEASES_DETECTED.total())}",
+        f"Запросы к GitHub: {_average(GITHUB_REQUEST_SECONDS)}",
+        "Ответы GitHub: " + (", ".join(f"{status}: {int(n)}" for status, n in sorted(statuses.items())) or "нет"),
+        f"Остаток лимита GitHub: {limits or 'неизвестен'}",
+        f"Файлы скачаны: {int(ASSET_FETCHES.total(result='miss'))} ({ASSET_DOWNLOAD_BYTES.total() / 2 ** 20:.1f} МБ), "
+        f"из кэша: {int(ASSET_FETCHES.total(result='hit'))}, ошибок: {int(ASSET_FETCHES.total(result='error'))}",
+        f"Отправка по file_id: {_average(SEND_DOCUMENT_SECONDS, kind='file_id')}",
+        f"Загрузка в Telegram: {_average(SEND_DOCUMENT_SECONDS, kind='upload')}",
+        f"RetryAfter: {int(TELEGRAM_RETRY_AFTER.total())}, ошибки Telegram: "
+        + (", ".join(f"{error}: {int(n)}" for error, n in sorted(failures.items())) or "нет"),
+        "Удалено недоступных получателей: "
+        + (", ".join(f"{reason}: {int(n)}" for reason, n in sorted(pruned.items())) or "нет"),
+        f"Очередь рассылки: {int(OUTBOX_PENDING.value() or 0)}, выполняется задач: {int(DELIVERY_ACTIVE.value() or 0)}",
+    ])
+
+@router.message(Command("stats"))
+async def stats_command(message: Message):
+    if message.from_user.id != config.ADMIN_ID:
+        await message.answer("Эта команда доступна только глобальному администратору.")
+        return
+    await message.answer(await stats_text())
+    logger.info(f"Админ {message.from_user.id} запросил статистику")
+
+@router.message(Command("pruned"))
+async def pruned_command(message: Message):
+    if message.from_user.id != config.ADMIN_ID:
+        await message.answer("Эта команда доступна только глобальному администратору.")
+        return
+    entries = await get_pruned_recipients(PRUNED_REPORT_SIZE)
+    if not entries:
+        await message.answer("Недоступных получателей не найдено.")
+        return
+    lines = [
+        f"{time.strftime('%d.%m %H:%M', time.localtime(pruned_at))} {chat_id}: "
+        + (f"перенесён в {migrated_to}" if migrated_to else reason)
+        + f" ({', '.join(keys)})"
+        for chat_id, reason, keys, migrated_to, pruned_at in entries
+    ]
+    await message.answer(f"🧹 Удалённые и перенесённые получатели (последние {len(entries)}):\n" + "\n".join(lines))
+    logger.info(f"Админ {message.from_user.id} запросил отчёт об удалённых получателях")
+
 @router.message(Command("checkupdates"))
 async def check_updates(message: Message, bot: Bot):
-    if message.from_user.id != ADMIN_ID:
+    if message.from_user.id != config.ADMIN_ID:
         await message.answer("Только глобальный администратор может проверять обновления.")
         return
     await message.answer("Проверка обновлений...")
@@ -378,26 +665,46 @@ async def app_selected(callback: CallbackQuery):
             if callback.message.chat.type == "private"
             else callback.message.chat.id in app.subscribers_chats
         )
-        is_admin = callback.from_user.id == ADMIN_ID
+        is_admin = callback.from_user.id == config.ADMIN_ID
         await callback.message.edit_text(f"{app.title}", reply_markup=get_app_menu(app, is_subscribed, is_admin))
         logger.info(f"Пользователь {callback.from_user.id} выбрал приложение: {key}")
     except Exception as e:
         logger.error(f"Ошибка при выборе приложения: {e}")
         await callback.message.edit_text("Произошла ошибка.")
 
-@router.callback_query(F.data == "back")
+@router.callback_query(F.data == "back" | F.data.startswith("back:"))
 async def go_back(callback: CallbackQuery):
     try:
-        apps = get_all_apps()
-        if not apps:
+        # Возвращаемся на страницу меню, с которой было выбрано приложение
+        key = callback.data.split(":", 1)[1] if ":" in callback.data else None
+        main_menu = get_main_menu(get_menu_page(key) if key else 0)
+        if not main_menu:
             await callback.message.edit_text("Пока нет доступных приложений.")
             return
-        await callback.message.edit_text("Главное меню:", reply_markup=get_main_menu(apps))
+        await callback.message.edit_text("Главное меню:", reply_markup=main_menu)
         logger.info(f"Пользователь {callback.from_user.id} вернулся в главное меню")
     except Exception as e:
         logger.error(f"Ошибка при возврате в меню: {e}")
         await callback.message.edit_text("Произошла ошибка.")
 
+@router.callback_query(F.data.startswith("menu:"))
+async def menu_page(callback: CallbackQuery):
+    try:
+        page = int(callback.data.split(":", 1)[1])
+        main_menu = get_main_menu(page)
+        if not main_menu:
+            await callback.message.edit_text("Пока нет доступных приложений.")
+            return
+        await callback.message.edit_reply_markup(reply_markup=main_menu)
+        await callback.answer()
+    except Exception as e:
+        logger.error(f"Ошибка при переходе по страницам меню: {e}")
+        await callback.answer("Произошла ошибка.")
+
+@router.callback_query(F.data == "noop")
+async def noop(callback: CallbackQuery):
+    await callback.answer()
+
 @router.callback_query(F.data.startswith("download:"))
 async def download_app(callback: CallbackQuery, bot: Bot):
     try:
@@ -406,51 +713,21 @@ async def download_app(callback: CallbackQuery, bot: Bot):
         if not app:
             await callback.message.edit_text("Приложение не найдено.")
             return
-        release = await get_latest_release(app.repo)
+        release = await get_cached_release(app.repo)
         if not release:
             await callback.message.edit_text("Релизы для этого приложения не найдены.")
             return
         if not app.asset_filters:
-            await callback.message.edit_text("Фильтры для файлов не указаны. Обновите через /setrepo.")
+            await callback.message.edit_text("Фильтры для файлов не указаны. Обновите через /setfilters.")
             return
         is_subscribed = (
             callback.from_user.id in app.subscribers_users
             if callback.message.chat.type == "private"
             else callback.message.chat.id in app.subscribers_chats
         )
-        is_admin = callback.from_user.id == ADMIN_ID
-        headers = {"Authorization": f"token {GITHUB_TOKEN}"} if GITHUB_TOKEN else {}
-        headers["Accept"] = "application/vnd.github+json"
-        headers["X-GitHub-Api-Version"] = "2022-11-28"
+        is_admin = callback.from_user.id == config.ADMIN_ID
         await callback.message.delete()  # Удаляем старое сообщение
-        await bot.send_message(callback.message.chat.id, "Отправка файлов...")
-        sent = False
-        caption = f"{app.title}: {release['name']}\n{release.get('body', 'Описание релиза отсутствует.')}"
-        async with aiohttp.ClientSession() as session:
-            for asset in release['assets']:
-                if any(fnmatch.fnmatch(asset['name'], f.strip()) for f in app.asset_filters):
-                    asset_url = asset['browser_download_url']
-                    logger.info(f"Загрузка файла: {asset_url} (имя: {asset['name']})")
-                    try:
-                        async with session.get(asset_url, headers=headers) as resp:
-                            if resp.status != 200:
-                                logger.error(f"Файл недоступен: {asset_url}, статус {resp.status}")
-                                continue
-                            file_data = await resp.read()
-                            await bot.send_document(
-                                chat_id=callback.message.chat.id,
-                                document=BufferedInputFile(file_data, filename=asset['name']),
-                                caption=caption if not sent else None
-                            )
-                            sent = True
-                            logger.info(f"Отправлен файл {asset['name']} для {app.title} в чат {callback.message.chat.id}")
-                    except Exception as e:
-                        logger.error(f"Ошибка при загрузке файла {asset['name']}: {e}")
-                        continue
-        if not sent:
-            await bot.send_message(callback.message.chat.id, "Подходящие файлы для скачивания не найдены или недоступны.")
-        else:
-            await bot.send_message(callback.message.chat.id, f"{app.title} (файлы успешно отправлены)", reply_markup=get_app_menu(app, is_subscribed, is_admin))
+        await send_app_files(bot, callback.message.chat.id, app, release, get_app_menu(app, is_subscribed, is_admin))
     except Exception as e:
         logger.error(f"Ошибка при скачивании: {e}")
         await bot.send_message(callback.message.chat.id, "Произошла ошибка.")
@@ -468,7 +745,7 @@ async def send_link(callback: CallbackQuery):
             if callback.message.chat.type == "private"
             else callback.message.chat.id in app.subscribers_chats
         )
-        is_admin = callback.from_user.id == ADMIN_ID
+        is_admin = callback.from_user.id == config.ADMIN_ID
         await callback.message.delete()  # Удаляем старое сообщение
         await callback.message.bot.send_message(callback.message.chat.id, f"{app.title}\n{app.link}", reply_markup=get_app_menu(app, is_subscribed, is_admin))
         logger.info(f"Отправлена ссылка для {app.title} пользователю {callback.from_user.id}")
@@ -477,43 +754,33 @@ async def send_link(callback: CallbackQuery):
         await callback.message.bot.send_message(callback.message.chat.id, "Произошла ошибка.")
 
 @router.callback_query(F.data.startswith("subscribe:"))
-async def toggle_subscription(callback: CallbackQuery):
+async def toggle_subscription(callback: CallbackQuery, bot: Bot):
     try:
         key = callback.data.split(":", 1)[1]
         app = get_app(key)
         if not app:
             await callback.message.edit_text("Приложение не найдено.")
             return
-        is_admin = callback.from_user.id == ADMIN_ID
+        is_admin = callback.from_user.id == config.ADMIN_ID
         if callback.message.chat.type == "private":
-            if callback.from_user.id in app.subscribers_users:
-                app.subscribers_users.remove(callback.from_user.id)
-                await callback.message.edit_text(f"Вы отписались от {app.title}")
-                logger.info(f"Пользователь {callback.from_user.id} отписался от {app.title}")
-            else:
-                app.subscribers_users.append(callback.from_user.id)
+            is_subscribed = await toggle_subscriber(app.key, callback.from_user.id, KIND_USER)
+            if is_subscribed:
                 await callback.message.edit_text(f"Вы подписались на {app.title}")
                 logger.info(f"Пользователь {callback.from_user.id} подписался на {app.title}")
-            save_app(app)
+            else:
+                await callback.message.edit_text(f"Вы отписались от {app.title}")
+                logger.info(f"Пользователь {callback.from_user.id} отписался от {app.title}")
         else:
-            chat_member = await callback.message.chat.get_member(callback.from_user.id)
-            if chat_member.status not in ["administrator", "creator"]:
+            if not await chat_admins.is_admin(bot, callback.message.chat.id, callback.from_user.id):
                 await callback.message.edit_text("Только администраторы группы могут управлять подпиской.")
                 return
-            if callback.message.chat.id in app.subscribers_chats:
-                app.subscribers_chats.remove(callback.message.chat.id)
-                await callback.message.edit_text(f"Чат отписан от {app.title}")
-                logger.info(f"Чат {callback.message.chat.id} отписан от {app.title}")
-            else:
-                app.subscribers_chats.append(callback.message.chat.id)
+            is_subscribed = await toggle_subscriber(app.key, callback.message.chat.id, KIND_CHAT)
+            if is_subscribed:
                 await callback.message.edit_text(f"Чат подписан на {app.title}")
                 logger.info(f"Чат {callback.message.chat.id} подписан на {app.title}")
-            save_app(app)
-        is_subscribed = (
-            callback.from_user.id in app.subscribers_users
-            if callback.message.chat.type == "private"
-            else callback.message.chat.id in app.subscribers_chats
-        )
+            else:
+                await callback.message.edit_text(f"Чат отписан от {app.title}")
+                logger.info(f"Чат {callback.message.chat.id} отписан от {app.title}")
         await callback.message.edit_reply_markup(reply_markup=get_app_menu(app, is_subscribed, is_admin))
     except Exception as e:
         logger.error(f"Ошибка при управлении подпиской: {e}")
@@ -521,7 +788,7 @@ async def toggle_subscription(callback: CallbackQuery):
 
 @router.callback_query(F.data.startswith("setrepo:"))
 async def set_repo_callback(callback: CallbackQuery, state: FSMContext):
-    if callback.from_user.id != ADMIN_ID:
+    if callback.from_user.id != config.ADMIN_ID:
         await callback.message.edit_text("Только глобальный администратор может устанавливать репозитории.")
         return
     key = callback.data.split(":", 1)[1]
@@ -536,15 +803,59 @@ async def set_repo_callback(callback: CallbackQuery, state: FSMContext):
 
 @router.callback_query(F.data.startswith("delete:"))
 async def delete_app_callback(callback: CallbackQuery):
-    if callback.from_user.id != ADMIN_ID:
+    if callback.from_user.id != config.ADMIN_ID:
         await callback.message.edit_text("Только глобальный администратор может удалять приложения.")
         return
     key = callback.data.split(":", 1)[1]
     if get_app(key):
-        delete_app(key)
+        await delete_app(key)
+        app_index.sync()
         await callback.message.edit_text(f"Приложение {key} удалено!")
-        apps = get_all_apps()
-        await callback.message.bot.send_message(callback.message.chat.id, "Главное меню:", reply_markup=get_main_menu(apps))
+        await callback.message.bot.send_message(callback.message.chat.id, "Главное меню:", reply_markup=get_main_menu())
         logger.info(f"Админ {callback.from_user.id} удалил приложение: {key}")
     else:
-        await callback.message.edit_text("Приложение не найдено.")
\ No newline at end of file
+        await callback.message.edit_text("Приложение не найдено.")
+
+@router.inline_query()
+async def inline_search(inline_query: InlineQuery, bot: Bot):
+    """Поиск приложений по ключу, названию и репозиторию: @бот запрос."""
+    try:
+        with HANDLER_SECONDS.time(prefix="inline"):
+            offset = int(inline_query.offset or 0)
+            apps = app_index.search(inline_query.query, limit=offset + INLINE_PAGE_SIZE)[offset:]
+        me = await bot.me()
+        results = [
+            InlineQueryResultArticle(
+                id=app.key,
+                title=app.title,
+                description=app.repo,
+                input_message_content=InputTextMessageContent(message_text=f"{app.title}\n{app.link}"),
+                reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
+                    InlineKeyboardButton(text="📦 Скачать", url=deep_link(me.username, "download", app.key)),
+                    InlineKeyboardButton(text="🔔 Подписаться", url=deep_link(me.username, "subscribe", app.key))
+                ]])
+            )
+            for app in apps
+        ]
+        next_offset = str(offset + len(apps)) if len(apps) == INLINE_PAGE_SIZE else ""
+        await inline_query.answer(results, cache_time=INLINE_CACHE_SECONDS, is_personal=False, next_offset=next_offset)
+    except Exception as e:
+        logger.error(f"Ошибка inline-поиска: {e}")
+
+@router.my_chat_member()
+@router.chat_member()
+async def chat_member_updated(event: ChatMemberUpdated, bot: Bot):
+    """Сбрасывает кэш администраторов группы, когда меняются права бота или участников.
+
+    Если пользователь заблокировал бота или бота удалили из группы, получатель сразу удаляется из рассылки.
+    """
+    chat_admins.invalidate(event.chat.id)
+    if event.new_chat_member.user.id == bot.id and event.new_chat_member.status in ("kicked", "left"):
+        description = "пользователь заблокировал бота" if event.chat.type == "private" else "бот удалён из чата"
+        await prune_unreachable(event.chat.id, "left", description)
+
+@router.message(F.migrate_to_chat_id)
+async def chat_migrated(message: Message):
+    """Переносит подписки группы на id супергруппы, в которую она преобразована."""
+    chat_admins.invalidate(message.chat.id)
+    await migrate_chat(message.chat.id, message.migrate_to_chat_id)
@@ -0,0 +1,45 @@
+import aiohttp
+import logging
+from typing import Optional
+from bot import config
+from bot.config import (
+    HTTP_POOL_SIZE, HTTP_POOL_PER_HOST, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_DNS_TTL
+)
+
+logger = logging.getLogger(__name__)
+
+_session: Optional[aiohttp.ClientSession] = None
+
+def github_headers() -> dict:
+    """Возвращает заголовки для запросов к GitHub REST API. Токен читается при каждом вызове (см. /reloadenv)."""
+    headers = {"Authorization": f"token {config.GITHUB_TOKEN}"} if config.GITHUB_TOKEN else {}
+    headers["Accept"] = "application/vnd.github+json"
+    headers["X-GitHub-Api-Version"] = "2022-11-28"
+    return headers
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Возвращает общий HTTP-клиент процесса, создавая его при первом обращении.
+
+    Клиент держит пул keep-alive соединений к api.github.com и CDN файлов релизов,
+    поэтому повторные запросы не тратят время на TCP/TLS-рукопожатия.
+    """
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_SIZE,
+            limit_per_host=HTTP_POOL_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_TTL,
+            keepalive_timeout=60
+        )
+        timeout = aiohttp.ClientTimeout(total=None, connect=HTTP_CONNECT_TIMEOUT, sock_read=HTTP_READ_TIMEOUT)
+        _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        logger.info("Создан общий HTTP-клиент")
+    return _session
+
+async def close_http_session():
+    """Закрывает общий HTTP-клиент при остановке бота."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logger.info("Общий HTTP-клиент закрыт")
+    _session = None
@@ -0,0 +1,224 @@
+import asyncio
+import importlib
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+from bot.config import (
+    LEADER_BACKEND, LEADER_LEASE_PATH, LEADER_LOCK_FILE, LEADER_LEASE_SECONDS, LEADER_RENEW_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+# Имя аренды: один ведущий на базу бота
+LEASE_NAME = "scheduler"
+
+class LeaderBackend:
+    """Хранилище аренды лидерства.
+
+    Для общего хранилища (PostgreSQL, Redis, etcd) достаточно реализовать acquire и release
+    и указать класс в LEADER_BACKEND как module:Class.
+    """
+
+    async def acquire(self, holder: str, ttl: float) -> bool:
+        """Захватывает или продлевает аренду на ttl секунд. Возвращает True, если она у holder."""
+        raise NotImplementedError
+
+    async def release(self, holder: str):
+        """Освобождает аренду, если она принадлежит holder."""
+        raise NotImplementedError
+
+class SQLiteLeaseBackend(LeaderBackend):
+    """Аренда в отдельном файле SQLite (чтобы продления не считались изменением основной базы).
+
+    Подходит для экземпляров на одной машине или с общей локальной файловой системой.
+    """
+
+    def __init__(self, path: str = LEADER_LEASE_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+        return self._conn
+
+    def _acquire(self, holder: str, ttl: float) -> bool:
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute('''
+                INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+                WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+            ''', (LEASE_NAME, holder, now + ttl, now))
+            current = conn.execute("SELECT holder FROM leases WHERE name = ?", (LEASE_NAME,)).fetchone()[0]
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return current == holder
+
+    def _release(self, holder: str):
+        self._connection().execute("DELETE FROM leases WHERE name = ? AND holder = ?", (LEASE_NAME, holder))
+
+    async def acquire(self, holder: str, ttl: float) -> bool:
+        return await asyncio.to_thread(self._acquire, holder, ttl)
+
+    async def release(self, holder: str):
+        await asyncio.to_thread(self._release, holder)
+
+class FileLockBackend(LeaderBackend):
+    """Блокировка файла (flock): снимается операционной системой сразу после завершения процесса."""
+
+    def __init__(self, path: str = LEADER_LOCK_FILE):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    async def acquire(self, holder: str, ttl: float) -> bool:
+        if self._fd is not None:
+            return True
+        import fcntl
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, holder.encode())
+        self._fd = fd
+        return True
+
+    async def release(self, holder: str):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+class SingleInstanceBackend(LeaderBackend):
+    """Без выбора: экземпляр всегда ведущий (запуск в одном экземпляре)."""
+
+    async def acquire(self, holder: str, ttl: float) -> bool:
+        return True
+
+    async def release(self, holder: str):
+        pass
+
+BACKENDS: Dict[str, Callable[[], LeaderBackend]] = {
+    "sqlite": SQLiteLeaseBackend,
+    "file": FileLockBackend,
+    "none": SingleInstanceBackend,
+}
+
+def register_backend(name: str, factory: Callable[[], LeaderBackend]):
+    """Регистрирует бэкенд, который затем можно выбрать через LEADER_BACKEND=name."""
+    BACKENDS[name] = factory
+
+def create_backend(name: str = LEADER_BACKEND) -> LeaderBackend:
+    """Создаёт бэкенд по имени из BACKENDS или по пути module:Class."""
+    if name in BACKENDS:
+        return BACKENDS[name]()
+    if ":" in name:
+        module, attribute = name.split(":", 1)
+        return getattr(importlib.import_module(module), attribute)()
+    raise ValueError(f"Неизвестный LEADER_BACKEND: {name}")
+
+class LeaderElector:
+    """Выбирает ведущий экземпляр, который опрашивает GitHub и разбирает очередь рассылки.
+
+    Аренда продлевается каждые renew_interval секунд. Если продлить её не удалось или продление
+    запоздало дольше ttl, экземпляр сразу перестаёт считать себя ведущим, чтобы два экземпляра
+    не рассылали одновременно. Обработчики кнопок и команд работают на всех экземплярах.
+    """
+
+    def __init__(self, backend: LeaderBackend, ttl: float, renew_interval: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._leader = False
+        self._renewed_at = 0.0
+        self._on_elected: List[Callable[[], Awaitable]] = []
+        self._on_demoted: List[Callable[[], Awaitable]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader and time.monotonic() - self._renewed_at < self.ttl
+
+    def on_elected(self, callback: Callable[[], Awaitable]):
+        self._on_elected.append(callback)
+
+    def on_demoted(self, callback: Callable[[], Awaitable]):
+        self._on_demoted.append(callback)
+
+    async def _notify(self, callbacks: List[Callable[[], Awaitable]]):
+        for callback in callbacks:
+            try:
+                await callback()
+            except Exception as e:
+                logger.error(f"Ошибка в обработчике смены ведущего: {e}")
+
+    async def _step(self):
+        started = time.monotonic()
+        try:
+            acquired = await self.backend.acquire(self.holder, self.ttl)
+        except Exception as e:
+            logger.error(f"Не удалось продлить аренду ведущего: {e}")
+            acquired = False
+        if acquired:
+            self._renewed_at = started
+        if acquired and not self._leader:
+            self._leader = True
+            logger.info(f"Экземпляр {self.holder} стал ведущим")
+            await self._notify(self._on_elected)
+        elif not acquired and self._leader:
+            self._leader = False
+            logger.warning(f"Экземпляр {self.holder} больше не ведущий")
+            await self._notify(self._on_demoted)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            await self._step()
+
+    async def start(self):
+        """Делает первую попытку захвата и продолжает продлевать аренду в фоне."""
+        await self._step()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Прекращает продление и освобождает аренду, чтобы другой экземпляр подхватил работу сразу."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._leader:
+            self._leader = False
+            await self._notify(self._on_demoted)
+            try:
+                await self.backend.release(self.holder)
+            except Exception as e:
+                logger.error(f"Не удалось освободить аренду ведущего: {e}")
+
+leader = LeaderElector(create_backend(), LEADER_LEASE_SECONDS, LEADER_RENEW_SECONDS)
+
+def leader_only(job: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+    """Оборачивает фоновое задание так, чтобы оно выполнялось только на ведущем экземпляре."""
+    async def wrapper(*args, **kwargs):
+        if leader.is_leader:
+            return await job(*args, **kwargs)
+    wrapper.__name__ = job.__name__
+    return wrapper
@@ -1,11 +1,22 @@
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.exceptions import TelegramUnauthorizedError
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from bot.config import BOT_TOKEN
+from bot.config import (
+    BOT_TOKEN, POLL_INTERVAL_MINUTES, METRICS_HOST, METRICS_PORT, UPDATE_MODE, CATALOG_REFRESH_SECONDS,
+    OUTBOX_POLL_SECONDS, TELEGRAM_API_URL, TELEGRAM_API_LOCAL
+)
 from bot.handlers import router
-from bot.services import check_releases
+from bot.services import check_releases, resume_outbox_drain, stop_outbox_drain, sync_catalog
+from bot.http_client import get_http_session, close_http_session
+from bot.storage import init_db, close_db
+from bot.leader import leader, leader_only
+from bot.search import app_index
+from bot.metrics import start_metrics_server, stop_metrics_server
+from bot.webhook import run_webhook
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,7 +30,11 @@ logger = logging.getLogger(__name__)
 
 async def main():
     try:
-        bot = Bot(token=BOT_TOKEN)
+        session = None
+        if TELEGRAM_API_URL:
+            # Собственный сервер Bot API: файлы до 2000 МБ и отправка по локальному пути
+            session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL, is_local=TELEGRAM_API_LOCAL))
+        bot = Bot(token=BOT_TOKEN, session=session)
     except TelegramUnauthorizedError as e:
         logger.error(f"Ошибка: Неверный токен Telegram-бота: {e}")
         return
@@ -28,14 +43,36 @@ async def main():
         return
 
     try:
+        await init_db()
+        # Индекс inline-поиска строится заранее, чтобы первый запрос не ждал
+        app_index.sync()
+        get_http_session()
+        if METRICS_PORT:
+            await start_metrics_server(METRICS_HOST, METRICS_PORT)
         dp = Dispatcher()
         dp.include_router(router)
         scheduler = AsyncIOScheduler()
-        scheduler.add_job(check_releases, 'interval', minutes=30, args=[bot])
+        # Опрос и рассылку выполняет только ведущий экземпляр; каталог обновляют все
+        scheduler.add_job(leader_only(check_releases), 'interval', minutes=POLL_INTERVAL_MINUTES, args=[bot])
+        scheduler.add_job(resume_outbox_drain, 'interval', seconds=OUTBOX_POLL_SECONDS, args=[bot])
+        scheduler.add_job(sync_catalog, 'interval', seconds=CATALOG_REFRESH_SECONDS)
         scheduler.start()
+        # Став ведущим, экземпляр возобновляет рассылки, прерванные остановкой прежнего ведущего
+        leader.on_elected(lambda: resume_outbox_drain(bot))
+        leader.on_demoted(stop_outbox_drain)
+        await leader.start()
         logger.info("Бот успешно запустился и работает нормально")
-        await dp.start_polling(bot)
+        if UPDATE_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            # После работы в режиме webhook getUpdates недоступен, пока webhook не удалён
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
     finally:
+        await leader.stop()
+        await stop_metrics_server()
+        await close_http_session()
+        await close_db()
         await bot.session.close()
 
 if __name__ == "__main__":
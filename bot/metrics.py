@@ -0,0 +1,239 @@
+import inspect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек по умолчанию, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SWEEP_BUCKETS = (1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+STARTED_AT = time.time()
+
+_metrics: List["_Metric"] = []
+# Функции, обновляющие датчики перед выдачей метрик (могут быть корутинами)
+_collectors: List[Callable] = []
+_runner: Optional[web.AppRunner] = None
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        _metrics.append(self)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def _matching(self, labels: Dict[str, object]) -> Iterator[Tuple[Tuple[str, ...], object]]:
+        """Значения, у которых совпадают указанные метки (остальные - любые)."""
+        wanted = {self.labels.index(name): str(value) for name, value in labels.items()}
+        for key, value in list(self._values.items()):
+            if all(key[index] == expected for index, expected in wanted.items()):
+                yield key, value
+
+    def _label_text(self, key: Tuple[str, ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def _samples(self) -> Iterator[str]:
+        for key, value in list(self._values.items()):
+            yield f"{self.name}{self._label_text(key)} {_format_value(value)}"
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик."""
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self, **labels) -> float:
+        """Сумма по всем значениям с указанными метками."""
+        return sum(value for _, value in self._matching(labels))
+
+    def by(self, label: str, **labels) -> Dict[str, float]:
+        """Суммы, сгруппированные по значению метки label."""
+        index = self.labels.index(label)
+        result: Dict[str, float] = {}
+        for key, value in self._matching(labels):
+            result[key[index]] = result.get(key[index], 0) + value
+        return result
+
+class Gauge(_Metric):
+    """Текущее значение (остаток лимита, длина очереди)."""
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def value(self, **labels) -> Optional[float]:
+        return self._values.get(self._key(labels))
+
+class Histogram(_Metric):
+    """Распределение длительностей по корзинам."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            # Счётчики по корзинам (не накопительные), затем сумма и количество
+            entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[0][index] += 1
+                break
+        entry[1] += value
+        entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замеряет время выполнения блока, в том числе завершившегося исключением."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def totals(self, **labels) -> Tuple[int, float]:
+        """Количество и сумма наблюдений по всем значениям с указанными метками."""
+        count, total = 0, 0.0
+        for _, entry in self._matching(labels):
+            count += entry[2]
+            total += entry[1]
+        return count, total
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Оценка квантиля по верхним границам корзин."""
+        counts = [0] * len(self.buckets)
+        observed = 0
+        for _, entry in self._matching(labels):
+            counts = [a + b for a, b in zip(counts, entry[0])]
+            observed += entry[2]
+        if not observed:
+            return None
+        seen = 0
+        for bound, count in zip(self.buckets, counts):
+            seen += count
+            if seen >= q * observed:
+                return bound
+        return float("inf")
+
+    def _samples(self) -> Iterator[str]:
+        for key, (counts, total, count) in list(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{self._label_text(key, (('le', _format_value(bound)),))} {cumulative}"
+            yield f"{self.name}_bucket{self._label_text(key, (('le', '+Inf'),))} {count}"
+            yield f"{self.name}_sum{self._label_text(key)} {_format_value(total)}"
+            yield f"{self.name}_count{self._label_text(key)} {count}"
+
+# GitHub
+GITHUB_REQUEST_SECONDS = Histogram(
+    "bot_github_request_seconds", "Длительность запросов к GitHub API", ("endpoint", "repo")
+)
+GITHUB_RESPONSES = Counter(
+    "bot_github_responses_total", "Ответы GitHub API по статусам (error - сетевая ошибка, deferred - отложен ограничителем)",
+    ("endpoint", "repo", "status")
+)
+GITHUB_RATELIMIT_REMAINING = Gauge(
+    "bot_github_ratelimit_remaining", "Остаток лимита GitHub API по заголовку X-RateLimit-Remaining", ("resource",)
+)
+
+# Опрос релизов
+POLL_SWEEP_SECONDS = Histogram("bot_poll_sweep_seconds", "Длительность цикла проверки релизов", buckets=SWEEP_BUCKETS)
+POLL_LAST_SWEEP = Gauge("bot_poll_last_sweep_timestamp_seconds", "Время окончания последнего цикла проверки")
+RELEASES_DETECTED = Counter("bot_releases_detected_total", "Найдено новых релизов")
+
+# Файлы релизов
+ASSET_FETCHES = Counter("bot_asset_fetches_total", "Обращения к дисковому кэшу файлов (hit, miss, error)", ("result",))
+ASSET_DOWNLOAD_BYTES = Counter("bot_asset_download_bytes_total", "Скачано байт файлов релизов")
+ASSET_DOWNLOAD_SECONDS = Histogram("bot_asset_download_seconds", "Длительность скачивания файла релиза")
+
+# Telegram
+SEND_DOCUMENT_SECONDS = Histogram(
+    "bot_send_document_seconds", "Длительность отправки файла с учётом ожидания лимитов (kind: file_id, upload)",
+    ("kind",)
+)
+TELEGRAM_FAILURES = Counter("bot_telegram_failures_total", "Ошибки запросов к Bot API по типу исключения", ("error",))
+TELEGRAM_RETRY_AFTER = Counter("bot_telegram_retry_after_total", "Ответы Bot API с RetryAfter")
+RECIPIENTS_PRUNED = Counter(
+    "bot_recipients_pruned_total", "Недоступные получатели, удалённые из рассылки, и перенесённые группы", ("reason",)
+)
+
+# Обработчики и очереди
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Длительность обработки нажатий по префиксу callback_data и inline-запросов (inline)", ("prefix",))
+OUTBOX_PENDING = Gauge("bot_outbox_pending", "Строк в очереди рассылки, ожидающих доставки")
+DELIVERY_ACTIVE = Gauge("bot_delivery_active", "Выполняющихся задач рассылки")
+GITHUB_IN_FLIGHT = Gauge("bot_github_in_flight", "Выполняющихся запросов к GitHub API", ("resource",))
+UPTIME = Gauge("bot_uptime_seconds", "Время работы процесса")
+
+def add_collector(collector: Callable):
+    """Регистрирует функцию, которая обновляет датчики перед каждой выдачей метрик."""
+    _collectors.append(collector)
+
+async def collect():
+    """Вызывает функции сбора; ошибка одной не мешает остальным."""
+    UPTIME.set(time.time() - STARTED_AT)
+    for collector in _collectors:
+        try:
+            result = collector()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.error(f"Ошибка сбора метрик в {collector.__name__}: {e}")
+
+async def render() -> str:
+    """Возвращает все метрики в текстовом формате Prometheus."""
+    await collect()
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(
+        body=(await render()).encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
+async def start_metrics_server(host: str, port: int):
+    """Запускает HTTP-сервер с метриками на GET /metrics."""
+    global _runner
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+
+async def stop_metrics_server():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
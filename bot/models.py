@@ -10,4 +10,21 @@ class App:
     asset_filters: List[str]
     subscribers_users: List[int]
     subscribers_chats: List[int]
-    latest_release: Optional[str] = None
\ No newline at end of file
+    latest_release: Optional[str] = None
+    # Отправлять файлы релиза альбомами (sendMediaGroup) вместо отдельных сообщений
+    album: bool = False
+
+@dataclass
+class Delivery:
+    """Строка очереди рассылки: релиз приложения для одного получателя."""
+    id: int
+    app_key: str
+    repo: str
+    tag: str
+    chat_id: int
+    caption: str
+    assets: List[dict]
+    sent_assets: int = 0
+    attempts: int = 0
+    # Подпись с описанием релиза уже ушла с одним из отправленных файлов
+    caption_sent: bool = False
@@ -0,0 +1,161 @@
+import re
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+from bot.models import App
+from bot.storage import get_all_apps, apps_revision
+
+# Слова короче этого ищутся только по префиксу, длиннее - ещё и по подстроке (триграммам)
+TRIGRAM = 3
+# Префиксы длиннее этого не индексируются: дальше совпадение проверяется по триграммам
+MAX_PREFIX = 16
+
+_WORD = re.compile(r"[^\W_]+")
+_EMPTY: Set[str] = frozenset()
+
+def _words(text: str) -> List[str]:
+    return _WORD.findall(text.casefold())
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + TRIGRAM] for i in range(len(text) - TRIGRAM + 1)}
+
+class AppIndex:
+    """Индекс поиска приложений по ключу, названию и репозиторию.
+
+    Префиксный индекс отвечает на начало любого слова, триграммный - на подстроку внутри слова
+    (например, "gram" в "Telegram"). Индекс сверяется с каталогом при изменении apps_revision
+    и переиндексирует только добавленные, удалённые и изменённые приложения.
+    """
+
+    def __init__(self):
+        self._revision = None
+        self._apps: Dict[str, App] = {}
+        self._fields: Dict[str, Tuple[str, str, str]] = {}
+        self._texts: Dict[str, str] = {}
+        self._prefixes: Dict[str, Set[str]] = defaultdict(set)
+        self._trigrams: Dict[str, Set[str]] = defaultdict(set)
+        # Префиксы названий целиком и порядок приложений по названию - для ранжирования без сортировки
+        self._title_prefixes: Dict[str, Set[str]] = defaultdict(set)
+        self._order: List[str] = []
+        self._position: Dict[str, int] = {}
+
+    @staticmethod
+    def _title_terms(app: App) -> Set[str]:
+        title = app.title.casefold()
+        return {title[:length] for length in range(1, min(len(title), MAX_PREFIX) + 1)}
+
+    def _index_terms(self, app: App) -> Tuple[Set[str], Set[str]]:
+        words = set(_words(app.key) + _words(app.title) + _words(app.repo))
+        # Ключ и имя репозитория ищутся и целиком, вместе с _ и -
+        words.update(term.casefold() for term in (app.key, app.repo, app.repo.rsplit("/", 1)[-1]))
+        prefixes = {word[:length] for word in words for length in range(1, min(len(word), MAX_PREFIX) + 1)}
+        trigrams = set().union(*(_trigrams(word) for word in words))
+        return prefixes, trigrams
+
+    def _add(self, app: App):
+        prefixes, trigrams = self._index_terms(app)
+        for prefix in prefixes:
+            self._prefixes[prefix].add(app.key)
+        for trigram in trigrams:
+            self._trigrams[trigram].add(app.key)
+        for prefix in self._title_terms(app):
+            self._title_prefixes[prefix].add(app.key)
+        self._apps[app.key] = app
+        self._fields[app.key] = (app.key, app.title, app.repo)
+        self._texts[app.key] = " ".join((app.key, app.title, app.repo)).casefold()
+
+    def _remove(self, key: str):
+        app = self._apps.pop(key)
+        prefixes, trigrams = self._index_terms(app)
+        for index, terms in (
+            (self._prefixes, prefixes), (self._trigrams, trigrams), (self._title_prefixes, self._title_terms(app))
+        ):
+            for term in terms:
+                keys = index[term]
+                keys.discard(key)
+                if not keys:
+                    del index[term]
+        del self._fields[key], self._texts[key]
+
+    def sync(self):
+        """Приводит индекс в соответствие с каталогом, если тот изменился."""
+        revision = apps_revision()
+        if revision == self._revision:
+            return
+        apps = {app.key: app for app in get_all_apps()}
+        for key in [key for key in self._apps if key not in apps]:
+            self._remove(key)
+        for key, app in apps.items():
+            if key in self._apps and self._fields[key] != (app.key, app.title, app.repo):
+                self._remove(key)
+            if key not in self._apps:
+                self._add(app)
+            else:
+                self._apps[key] = app
+        self._order = sorted(self._apps, key=lambda key: (self._apps[key].title.casefold(), key))
+        self._position = {key: position for position, key in enumerate(self._order)}
+        self._revision = revision
+
+    def _match_word(self, word: str) -> Set[str]:
+        keys = self._prefixes.get(word[:MAX_PREFIX], _EMPTY)
+        if len(word) > MAX_PREFIX:
+            keys = {key for key in keys if word in self._texts[key]}
+        if len(word) >= TRIGRAM:
+            grams = sorted((self._trigrams.get(gram, _EMPTY) for gram in _trigrams(word)), key=len)
+            candidates = grams[0].intersection(*grams[1:]) - keys
+            found = {key for key in candidates if word in self._texts[key]}
+            if found:
+                keys = keys | found
+        return keys
+
+    def _estimate(self, word: str) -> int:
+        """Оценка числа совпадений слова: размер префиксного и самого редкого триграммного списка."""
+        estimate = len(self._prefixes.get(word[:MAX_PREFIX], _EMPTY))
+        if len(word) >= TRIGRAM:
+            estimate += min(len(self._trigrams.get(gram, _EMPTY)) for gram in _trigrams(word))
+        return estimate
+
+    def _rank(self, keys: Set[str], needle: str, limit: int) -> List[str]:
+        ranked = [needle] if needle in keys else []
+        starts = self._title_prefixes.get(needle[:MAX_PREFIX], _EMPTY) & keys
+        ranked += sorted(
+            (key for key in starts if key != needle and self._apps[key].title.casefold().startswith(needle)),
+            key=self._position.__getitem__
+        )
+        if len(ranked) >= limit:
+            return ranked[:limit]
+        seen = set(ranked)
+        if len(keys) <= limit * 4:
+            rest = sorted((key for key in keys if key not in seen), key=self._position.__getitem__)
+            return ranked + rest[:limit - len(ranked)]
+        # Совпадений много: обходим приложения по названию, пока не наберём limit
+        for key in self._order:
+            if key in keys and key not in seen:
+                ranked.append(key)
+                if len(ranked) == limit:
+                    break
+        return ranked
+
+    def search(self, query: str, limit: int = 50) -> List[App]:
+        """Возвращает до limit приложений, в которых встречаются все слова запроса.
+
+        Точное совпадение ключа идёт первым, затем совпадения с началом названия, остальные - по названию.
+        """
+        self.sync()
+        words = _words(query)
+        if not words:
+            return [self._apps[key] for key in self._order[:limit]]
+        # По индексу ищем самое редкое слово, а остальные проверяем только у найденных приложений
+        words = sorted(set(words), key=self._estimate)
+        keys = self._match_word(words[0])
+        for word in words[1:]:
+            if not keys:
+                break
+            if len(word) >= TRIGRAM:
+                keys = {key for key in keys if word in self._texts[key]}
+            else:
+                keys = keys & self._prefixes.get(word, _EMPTY)
+        if not keys:
+            return []
+        return [self._apps[key] for key in self._rank(keys, query.strip().casefold(), limit)]
+
+app_index = AppIndex()
@@ -1,113 +1,564 @@
-import aiohttp
+import asyncio
 import logging
+import os
+import time
+from contextlib import AsyncExitStack, ExitStack
+from typing import BinaryIO, Dict, List, Optional, Tuple
 from aiogram import Bot
-from aiogram.types import BufferedInputFile
-from bot.storage import get_all_apps, save_app
-from bot.config import GITHUB_TOKEN
-from bot.models import App
-import fnmatch
+from aiogram.exceptions import TelegramBadRequest, TelegramEntityTooLarge, TelegramMigrateToChat
+from aiogram.types import InputMediaDocument, Message
+from bot.storage import (
+    get_all_apps, get_app, save_app, get_file_id, save_file_id, delete_file_id, get_cached_response,
+    save_cached_response, refresh_catalog, enqueue_release, get_pending_deliveries, update_delivery_progress, complete_delivery,
+    fail_delivery, count_pending_deliveries, prune_outbox, prune_recipient, migrate_recipient, count_pruned_recipients,
+    is_delivery_pending
+)
+from bot import config
+from bot.config import (
+    GITHUB_API_URL, POLL_INTERVAL_MINUTES, RELEASE_CACHE_TTL, POLL_CONCURRENCY, POLL_TIMEOUT, POLL_BACKEND,
+    GRAPHQL_BATCH_SIZE, OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETENTION_DAYS, TELEGRAM_API_LOCAL,
+    TELEGRAM_UPLOAD_LIMIT_MB, TELEGRAM_UPLOAD_TIMEOUT
+)
+from bot.asset_cache import CachedInputFile, open_asset, prefetch_asset, hold_assets, local_upload_path
+from bot.asset_filters import get_matcher
+from bot.delivery import delivery, upload_lock, unreachable_reason
+from bot.github_graphql import get_latest_releases_batch
+from bot.github_ratelimit import github_limiter, PRIORITY_INTERACTIVE, PRIORITY_POLL
+from bot.http_client import get_http_session, github_headers
+from bot.leader import leader
+from bot.metrics import (
+    GITHUB_REQUEST_SECONDS, GITHUB_RESPONSES, POLL_SWEEP_SECONDS, POLL_LAST_SWEEP, RELEASES_DETECTED,
+    SEND_DOCUMENT_SECONDS, OUTBOX_PENDING, RECIPIENTS_PRUNED, add_collector
+)
+from bot.models import App, Delivery
 
 logger = logging.getLogger(__name__)
 
-async def get_latest_release(repo: str) -> dict:
-    headers = {"Authorization": f"token {GITHUB_TOKEN}"} if GITHUB_TOKEN else {}
-    headers["Accept"] = "application/vnd.github+json"
-    headers["X-GitHub-Api-Version"] = "2022-11-28"
+# Наибольший размер файла, который загружается в Telegram; для больших отправляется ссылка
+UPLOAD_LIMIT_BYTES = TELEGRAM_UPLOAD_LIMIT_MB * 1024 ** 2
+# Наибольшее число файлов в альбоме sendMediaGroup
+ALBUM_MAX_ITEMS = 10
+
+# Время последнего успешного опроса каждого репозитория (time.monotonic())
+_last_polled = {}
+
+# Кэш последних релизов для скачивания по кнопке: репозиторий -> (time.monotonic(), релиз).
+# Наполняется опросом; одновременные промахи по одному репозиторию ждут один общий запрос.
+_release_cache: Dict[str, Tuple[float, dict]] = {}
+_release_fetches: Dict[str, asyncio.Task] = {}
+
+# Очередь рассылки разбирается одним фоновым заданием
+_drain_lock = asyncio.Lock()
+_drain_task: Optional[asyncio.Task] = None
+# Получатели, удалённые из рассылки в текущем проходе: их оставшиеся строки из пачки не отправляются
+_pruned_chats = set()
+
+async def get_latest_release(repo: str, priority: int = PRIORITY_INTERACTIVE) -> dict:
+    """Возвращает последний релиз репозитория. Запрос условный: при HTTP 304 отдаётся сохранённый ответ.
+
+    Если лимит GitHub API исчерпан или запрос отложен ограничителем, интерактивный вызов
+    получает последний сохранённый ответ, а фоновый опрос - None.
+    """
+    url = f"{GITHUB_API_URL}/repos/{repo}/releases/latest"
+    headers = github_headers()
+    cached = await get_cached_response(url)
+    stale = cached[2] if cached and priority == PRIORITY_INTERACTIVE else None
+    if cached:
+        etag, last_modified, _ = cached
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    if not github_limiter.acquire("core", priority):
+        logger.warning(f"Запрос релиза для {repo} отложен: лимит GitHub API почти исчерпан")
+        GITHUB_RESPONSES.inc(endpoint="rest", repo=repo, status="deferred")
+        return stale
+    started = time.perf_counter()
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"https://api.github.com/repos/{repo}/releases/latest", headers=headers) as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                elif resp.status == 401:
-                    logger.error(f"Ошибка авторизации для {repo}: HTTP 401 - Неверный токен")
-                    return None
-                elif resp.status == 403:
-                    logger.warning(f"Превышен лимит запросов к GitHub API для {repo}")
-                    return None
-                else:
-                    logger.error(f"Ошибка при получении релиза для {repo}: HTTP {resp.status}")
-                    return None
+        async with get_http_session().get(url, headers=headers) as resp:
+            body = await resp.text() if resp.status in (403, 429) else ""
+            limited = github_limiter.update("core", resp.status, resp.headers, body)
+            GITHUB_RESPONSES.inc(endpoint="rest", repo=repo, status=resp.status)
+            if resp.status == 200:
+                release = await resp.json()
+                if resp.headers.get("ETag") or resp.headers.get("Last-Modified"):
+                    await save_cached_response(url, resp.headers.get("ETag"), resp.headers.get("Last-Modified"), release)
+                return release
+            elif resp.status == 304 and cached:
+                return cached[2]
+            elif resp.status == 401:
+                logger.error(f"Ошибка авторизации для {repo}: HTTP 401 - Неверный токен")
+                return None
+            elif limited:
+                logger.warning(f"Превышен лимит запросов к GitHub API для {repo}")
+                return stale
+            else:
+                logger.error(f"Ошибка при получении релиза для {repo}: HTTP {resp.status}")
+                return None
     except Exception as e:
         logger.error(f"Ошибка при запросе релиза для {repo}: {e}")
+        GITHUB_RESPONSES.inc(endpoint="rest", repo=repo, status="error")
         return None
+    finally:
+        GITHUB_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint="rest", repo=repo)
+        github_limiter.release("core")
 
 async def get_release_assets(repo: str) -> list:
-    headers = {"Authorization": f"token {GITHUB_TOKEN}"} if GITHUB_TOKEN else {}
-    headers["Accept"] = "application/vnd.github+json"
-    headers["X-GitHub-Api-Version"] = "2022-11-28"
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"https://api.github.com/repos/{repo}/releases/latest", headers=headers) as resp:
-                if resp.status == 200:
-                    release = await resp.json()
-                    return [asset['name'] for asset in release['assets']]
-                elif resp.status == 401:
-                    logger.error(f"Ошибка авторизации для активов {repo}: HTTP 401 - Неверный токен")
-                    return []
-                return []
-    except Exception as e:
-        logger.error(f"Ошибка при получении активов для {repo}: {e}")
+    release = await get_latest_release(repo)
+    if not release:
         return []
+    return [asset['name'] for asset in release['assets']]
+
+def remember_release(repo: str, release: dict):
+    """Сохраняет свежие данные о последнем релизе репозитория в кэш."""
+    _release_cache[repo] = (time.monotonic(), release)
+
+def _fetch_release(repo: str) -> asyncio.Task:
+    """Запускает запрос релиза или возвращает уже идущий запрос для того же репозитория."""
+    task = _release_fetches.get(repo)
+    if task is None:
+        async def fetch():
+            try:
+                release = await get_latest_release(repo)
+                if release:
+                    remember_release(repo, release)
+                return release
+            finally:
+                _release_fetches.pop(repo, None)
+        task = _release_fetches[repo] = asyncio.create_task(fetch())
+    return task
+
+def forget_stale_releases():
+    """Удаляет из кэша релизы, тег которых отличается от последнего тега приложений этого репозитория в каталоге.
+
+    Новые релизы находит только ведущий экземпляр; остальные узнают о них из каталога и при следующем
+    нажатии «Скачать» запрашивают релиз заново (условным запросом по ETag, сохранённому ведущим).
+    """
+    latest: Dict[str, set] = {}
+    for app in get_all_apps():
+        if app.latest_release:
+            latest.setdefault(app.repo, set()).add(app.latest_release)
+    for repo, (_, release) in list(_release_cache.items()):
+        if repo in latest and release.get('tag_name') not in latest[repo]:
+            del _release_cache[repo]
+
+async def sync_catalog():
+    """Перечитывает каталог, если его изменил другой экземпляр, и сбрасывает устаревшие релизы в кэше."""
+    if await refresh_catalog():
+        forget_stale_releases()
+
+async def get_cached_release(repo: str) -> Optional[dict]:
+    """Возвращает последний релиз из кэша, обращаясь к GitHub только при отсутствии данных.
+
+    Устаревшая запись (старше RELEASE_CACHE_TTL) отдаётся сразу, а обновляется в фоне.
+    """
+    cached = _release_cache.get(repo)
+    if cached:
+        if time.monotonic() - cached[0] > RELEASE_CACHE_TTL:
+            _fetch_release(repo)
+        return cached[1]
+    # shield: отмена одного ожидающего не должна отменять общий запрос
+    return await asyncio.shield(_fetch_release(repo))
+
+async def send_asset(bot: Bot, chat_id: int, repo: str, tag: str, asset: dict, caption: str = None,
+                     interactive: bool = False) -> bool:
+    """Отправляет файл релиза в чат. Повторные отправки идут по сохранённому file_id без загрузки.
+
+    Пока один получатель загружает файл, остальные ждут и отправляют его по полученному file_id.
+    """
+    key = (repo, tag, asset['name'])
+    file_id = await get_file_id(*key)
+    if not file_id and (asset.get('size') or 0) > UPLOAD_LIMIT_BYTES:
+        return await send_asset_link(bot, chat_id, asset, caption, interactive)
+    if not file_id:
+        async with upload_lock(key):
+            file_id = await get_file_id(*key)
+            if not file_id:
+                return await upload_asset(bot, chat_id, repo, tag, asset, caption, interactive)
+    try:
+        with SEND_DOCUMENT_SECONDS.time(kind="file_id"):
+            await delivery.call(
+                chat_id, lambda: bot.send_document(chat_id=chat_id, document=file_id, caption=caption), interactive
+            )
+        logger.info(f"Файл {asset['name']} отправлен в чат {chat_id} по file_id")
+        return True
+    except TelegramBadRequest as e:
+        if unreachable_reason(e):
+            raise
+        logger.warning(f"file_id для {asset['name']} ({repo} {tag}) недействителен, загружаем заново: {e}")
+        await delete_file_id(*key)
+    async with upload_lock(key):
+        return await upload_asset(bot, chat_id, repo, tag, asset, caption, interactive)
+
+async def prefetch_assets(repo: str, tag: str, assets: List[dict]):
+    """Начинает скачивать в кэш файлы, которые ещё не загружены в Telegram.
+
+    Вызывается перед последовательной отправкой файлов релиза: пока загружается текущий файл,
+    следующие уже скачиваются, а отправка берёт их из кэша. Порядок отправки не меняется.
+    """
+    for asset in assets:
+        if (asset.get('size') or 0) <= UPLOAD_LIMIT_BYTES and not await get_file_id(repo, tag, asset['name']):
+            prefetch_asset(repo, tag, asset)
+
+async def send_asset_link(bot: Bot, chat_id: int, asset: dict, caption: str = None,
+                          interactive: bool = False) -> bool:
+    """Отправляет ссылку на файл, который больше лимита загрузки Bot API."""
+    size = f" ({asset['size'] / 1024 ** 2:.0f} МБ)" if asset.get('size') else ""
+    text = f"📎 {asset['name']}{size}: {asset['browser_download_url']}"
+    if caption:
+        text = f"{caption}\n\n{text}"
+    await delivery.call(chat_id, lambda: bot.send_message(chat_id=chat_id, text=text), interactive)
+    logger.info(f"Файл {asset['name']} больше {TELEGRAM_UPLOAD_LIMIT_MB} МБ, в чат {chat_id} отправлена ссылка")
+    return True
+
+async def upload_asset(bot: Bot, chat_id: int, repo: str, tag: str, asset: dict, caption: str = None,
+                       interactive: bool = False) -> bool:
+    """Скачивает файл релиза в дисковый кэш, загружает его в чат и сохраняет полученный file_id.
+
+    Файл передаётся из открытого файла кэша частями, а локальному серверу Bot API (TELEGRAM_API_LOCAL) -
+    путём к файлу. Если файл больше лимита загрузки, вместо него отправляется ссылка.
+    """
+    logger.info(f"Загрузка файла для чата {chat_id}: {asset['browser_download_url']} (имя: {asset['name']})")
+    # Файл защищён от вытеснения из кэша этого экземпляра, пока загружается
+    with hold_assets(repo, tag, [asset]):
+        file = await open_asset(repo, tag, asset)
+        if not file:
+            return False
+        with file:
+            if os.fstat(file.fileno()).st_size > UPLOAD_LIMIT_BYTES:
+                return await send_asset_link(bot, chat_id, asset, caption, interactive)
+            try:
+                message = await _upload_file(bot, chat_id, file, asset, caption, interactive)
+            except TelegramEntityTooLarge:
+                return await send_asset_link(bot, chat_id, asset, caption, interactive)
+        if message.document:
+            await save_file_id(repo, tag, asset['name'], message.document.file_id)
+        return True
+
+async def _upload_file(bot: Bot, chat_id: int, file: BinaryIO, asset: dict, caption: Optional[str],
+                       interactive: bool) -> Message:
+    with SEND_DOCUMENT_SECONDS.time(kind="upload"):
+        if TELEGRAM_API_LOCAL:
+            with local_upload_path(file.name, asset['name']) as server_path:
+                return await delivery.call(chat_id, lambda: bot.send_document(
+                    chat_id=chat_id,
+                    document=f"file://{server_path}",
+                    caption=caption,
+                    request_timeout=TELEGRAM_UPLOAD_TIMEOUT
+                ), interactive)
+        return await delivery.call(chat_id, lambda: bot.send_document(
+            chat_id=chat_id,
+            document=CachedInputFile(file, asset['name']),
+            caption=caption,
+            request_timeout=TELEGRAM_UPLOAD_TIMEOUT
+        ), interactive)
+
+def asset_groups(assets: List[dict], album: bool) -> List[List[dict]]:
+    """Делит файлы релиза на отправки: по одному или альбомами до ALBUM_MAX_ITEMS файлов."""
+    size = ALBUM_MAX_ITEMS if album else 1
+    return [assets[i:i + size] for i in range(0, len(assets), size)]
+
+async def send_assets(bot: Bot, chat_id: int, repo: str, tag: str, assets: List[dict], caption: str = None,
+                      interactive: bool = False) -> bool:
+    """Отправляет группу файлов из asset_groups: один файл - документом, несколько - альбомом."""
+    if len(assets) == 1:
+        return await send_asset(bot, chat_id, repo, tag, assets[0], caption, interactive)
+    return await send_album(bot, chat_id, repo, tag, assets, caption, interactive)
+
+async def _send_one_by_one(bot: Bot, chat_id: int, repo: str, tag: str, assets: List[dict], caption: str = None,
+                           interactive: bool = False) -> bool:
+    sent = False
+    for asset in assets:
+        if await send_asset(bot, chat_id, repo, tag, asset, caption if not sent else None, interactive):
+            sent = True
+    return sent
+
+async def send_album(bot: Bot, chat_id: int, repo: str, tag: str, assets: List[dict], caption: str = None,
+                     interactive: bool = False) -> bool:
+    """Отправляет до ALBUM_MAX_ITEMS файлов релиза одним сообщением sendMediaGroup с подписью у первого.
+
+    Загруженные ранее файлы идут по file_id, остальные загружаются в том же запросе, а полученные
+    file_id сохраняются. Если в альбоме есть файл больше лимита загрузки, файл недоступен или Telegram
+    отклонил альбом, файлы отправляются по одному через send_asset.
+    """
+    with hold_assets(repo, tag, assets):
+        keys = [(repo, tag, asset['name']) for asset in assets]
+        file_ids = [await get_file_id(*key) for key in keys]
+        if any(not file_id and (asset.get('size') or 0) > UPLOAD_LIMIT_BYTES for asset, file_id in zip(assets, file_ids)):
+            return await _send_one_by_one(bot, chat_id, repo, tag, assets, caption, interactive)
+        async with AsyncExitStack() as locks:
+            missing = [index for index, file_id in enumerate(file_ids) if not file_id]
+            if missing:
+                # Блокировки берутся в одном порядке, чтобы два альбома не ждали друг друга
+                for key in sorted({keys[index] for index in missing}):
+                    await locks.enter_async_context(upload_lock(key))
+                for index in missing:
+                    file_ids[index] = await get_file_id(*keys[index])
+                missing = [index for index, file_id in enumerate(file_ids) if not file_id]
+            with ExitStack() as links:
+                files = dict(zip(missing, await asyncio.gather(*(open_asset(repo, tag, assets[index]) for index in missing))))
+                for file in files.values():
+                    if file:
+                        links.enter_context(file)
+                if any(not file or os.fstat(file.fileno()).st_size > UPLOAD_LIMIT_BYTES for file in files.values()):
+                    links.close()
+                    await locks.aclose()
+                    return await _send_one_by_one(bot, chat_id, repo, tag, assets, caption, interactive)
+                media = []
+                for index, asset in enumerate(assets):
+                    if file_ids[index]:
+                        document = file_ids[index]
+                    elif TELEGRAM_API_LOCAL:
+                        document = f"file://{links.enter_context(local_upload_path(files[index].name, asset['name']))}"
+                    else:
+                        document = CachedInputFile(files[index], asset['name'])
+                    media.append(InputMediaDocument(media=document, caption=caption if index == 0 else None))
+                try:
+                    with SEND_DOCUMENT_SECONDS.time(kind="album"):
+                        messages = await delivery.call(chat_id, lambda: bot.send_media_group(
+                            chat_id=chat_id, media=media, request_timeout=TELEGRAM_UPLOAD_TIMEOUT
+                        ), interactive)
+                except (TelegramBadRequest, TelegramEntityTooLarge) as e:
+                    if unreachable_reason(e):
+                        raise
+                    logger.warning(f"Альбом из {len(assets)} файлов ({repo} {tag}) не отправлен, отправляем по одному: {e}")
+                    messages = None
+            if messages is None:
+                await locks.aclose()
+                return await _send_one_by_one(bot, chat_id, repo, tag, assets, caption, interactive)
+            for index in missing:
+                if messages[index].document:
+                    await save_file_id(*keys[index], messages[index].document.file_id)
+        logger.info(f"Альбом из {len(assets)} файлов ({repo} {tag}) отправлен в чат {chat_id}")
+        return True
+
+async def poll_releases(apps: List[App]) -> List[Tuple[App, dict]]:
+    """Параллельно запрашивает последние релизы и возвращает приложения с новым тегом.
+
+    Одновременно выполняется не больше POLL_CONCURRENCY запросов, каждый ограничен POLL_TIMEOUT
+    секундами. Репозиторий, общий для нескольких приложений, запрашивается один раз.
+    При POLL_BACKEND=graphql репозитории запрашиваются пачками по GRAPHQL_BATCH_SIZE,
+    а пачки, которые не удалось получить, повторяются через REST.
+    """
+    semaphore = asyncio.Semaphore(POLL_CONCURRENCY)
+
+    async def bounded(coro, description: str):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(coro, POLL_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"Превышено время ожидания ответа GitHub для {description} ({POLL_TIMEOUT} с)")
+                return None
+
+    # Сначала опрашиваются репозитории, которые дольше всех не удавалось проверить,
+    # чтобы отложенные из-за лимита не откладывались каждый цикл
+    repos = sorted({app.repo for app in apps}, key=lambda repo: _last_polled.get(repo, 0.0))
+    github_limiter.begin_cycle(POLL_INTERVAL_MINUTES * 60)
+    releases = {}
+    if POLL_BACKEND == "graphql" and config.GITHUB_TOKEN:
+        batches = [repos[i:i + GRAPHQL_BATCH_SIZE] for i in range(0, len(repos), GRAPHQL_BATCH_SIZE)]
+        results = await asyncio.gather(*(
+            bounded(get_latest_releases_batch(batch), f"пачки из {len(batch)} репозиториев") for batch in batches
+        ))
+        for result in results:
+            if result:
+                releases.update(result)
+    elif POLL_BACKEND == "graphql":
+        logger.warning("POLL_BACKEND=graphql требует GITHUB_TOKEN, используется REST")
+    rest_repos = [repo for repo in repos if repo not in releases]
+    releases.update(zip(rest_repos, await asyncio.gather(*(
+        bounded(get_latest_release(repo, PRIORITY_POLL), repo) for repo in rest_repos
+    ))))
+    now = time.monotonic()
+    for repo, release in releases.items():
+        if release:
+            _last_polled[repo] = now
+            remember_release(repo, release)
+    return [
+        (app, releases[app.repo]) for app in apps
+        if releases[app.repo] and releases[app.repo]['tag_name'] != app.latest_release
+    ]
+
+async def prune_unreachable(chat_id: int, reason: str, description: str) -> List[str]:
+    """Удаляет недоступного получателя из рассылки. reason - причина для метрики (forbidden, not_found, left)."""
+    _pruned_chats.add(chat_id)
+    keys = await prune_recipient(chat_id, description)
+    if keys:
+        RECIPIENTS_PRUNED.inc(reason=reason)
+        logger.warning(f"Получатель {chat_id} недоступен ({description}), удалены подписки: {', '.join(keys)}")
+    return keys
+
+async def migrate_chat(old_chat_id: int, new_chat_id: int) -> List[str]:
+    """Переносит подписки группы, преобразованной в супергруппу, на её новый id."""
+    keys = await migrate_recipient(old_chat_id, new_chat_id)
+    if keys:
+        RECIPIENTS_PRUNED.inc(reason="migrated")
+        logger.info(f"Группа {old_chat_id} перенесена в {new_chat_id}, подписки: {', '.join(keys)}")
+    return keys
+
+class DeliverySuperseded(Exception):
+    """Строка очереди снята после переноса группы: у супергруппы уже есть своя строка этого релиза."""
+
+async def _send_to_recipient(bot: Bot, item: Delivery, group: List[dict], caption: Optional[str]) -> bool:
+    """Отправляет группу файлов получателю строки очереди. Если группа стала супергруппой,
+    переносит подписки и строки очереди на новый id и повторяет отправку туда."""
+    try:
+        return await send_assets(bot, item.chat_id, item.repo, item.tag, group, caption)
+    except TelegramMigrateToChat as e:
+        await migrate_chat(item.chat_id, e.migrate_to_chat_id)
+        if not await is_delivery_pending(item.id):
+            raise DeliverySuperseded(e.migrate_to_chat_id)
+        item.chat_id = e.migrate_to_chat_id
+        return await send_assets(bot, item.chat_id, item.repo, item.tag, group, caption)
+
+async def _fail_attempt(item: Delivery):
+    """Учитывает неудачную попытку: строка останется в очереди до OUTBOX_MAX_ATTEMPTS попыток."""
+    if await fail_delivery(item.id, OUTBOX_MAX_ATTEMPTS):
+        logger.error(f"Доставка {item.app_key} {item.tag} в чат {item.chat_id} прекращена после {OUTBOX_MAX_ATTEMPTS} попыток")
+
+async def deliver(bot: Bot, item: Delivery):
+    """Доставляет релиз одному получателю из очереди, продолжая с первого неотправленного файла."""
+    if item.chat_id in _pruned_chats:
+        return
+    app = get_app(item.app_key)
+    # Заранее скачанные файлы не должны быть вытеснены из кэша до своей отправки
+    with hold_assets(item.repo, item.tag, item.assets[item.sent_assets:]):
+        # Первый файл скачивает сама отправка, следующие скачиваются заранее
+        await prefetch_assets(item.repo, item.tag, item.assets[item.sent_assets + 1:])
+        index = item.sent_assets
+        for group in asset_groups(item.assets[index:], bool(app and app.album)):
+            # Подпись идёт с первым отправленным файлом; при возобновлении она могла уже уйти
+            caption = None if item.caption_sent else item.caption
+            names = ", ".join(asset['name'] for asset in group)
+            try:
+                sent = await _send_to_recipient(bot, item, group, caption)
+            except DeliverySuperseded as e:
+                logger.info(f"Доставка {item.app_key} {item.tag} в чат {item.chat_id} продолжится строкой супергруппы {e}")
+                return
+            except Exception as e:
+                reason = unreachable_reason(e)
+                if reason:
+                    # Повторные попытки бесполезны: получатель удаляется из рассылки вместе с его строками очереди
+                    await prune_unreachable(item.chat_id, reason, e.message)
+                    return
+                logger.error(f"Ошибка загрузки файлов {names} для чата {item.chat_id}: {e}")
+                await _fail_attempt(item)
+                return
+            if not sent:
+                # Файл не удалось скачать: доставка повторится со следующим проходом
+                logger.error(f"Файлы {names} для чата {item.chat_id} недоступны")
+                await _fail_attempt(item)
+                return
+            logger.info(f"Отправлено: {names} ({item.app_key} {item.tag}) в чат {item.chat_id}")
+            item.caption_sent = True
+            index += len(group)
+            await update_delivery_progress(item.id, index)
+    await complete_delivery(item.id)
+
+async def _report_pruned(bot: Bot, since: float):
+    """Сообщает администратору, сколько получателей удалено и групп перенесено за проход рассылки."""
+    pruned, migrated = await count_pruned_recipients(since)
+    if not pruned and not migrated:
+        return
+    logger.warning(f"За проход рассылки удалено недоступных получателей: {pruned}, перенесено групп: {migrated}")
+    admin_id = config.ADMIN_ID
+    if admin_id:
+        try:
+            await delivery.call(admin_id, lambda: bot.send_message(
+                chat_id=admin_id,
+                text=f"🧹 Рассылка: удалено недоступных получателей: {pruned}, перенесено групп: {migrated}.\n"
+                     f"Подробнее: /pruned"
+            ))
+        except Exception as e:
+            logger.error(f"Не удалось отправить администратору отчёт об удалённых получателях: {e}")
+
+async def drain_outbox(bot: Bot):
+    """Разбирает очередь рассылки пачками по OUTBOX_BATCH_SIZE строк, каждую строку - один раз за проход.
+
+    Пачки выбираются по id после последней строки предыдущей пачки, поэтому строки, оставшиеся
+    в очереди после неудачной попытки, ждут следующего прохода.
+    """
+    async with _drain_lock:
+        attempted = 0
+        last_id = 0
+        started = time.time()
+        _pruned_chats.clear()
+        while leader.is_leader:
+            batch = await get_pending_deliveries(OUTBOX_BATCH_SIZE, after_id=last_id)
+            if not batch:
+                break
+            attempted += len(batch)
+            last_id = batch[-1].id
+            results = await delivery.run(deliver(bot, item) for item in batch)
+            for item, result in zip(batch, results):
+                # Ошибка вне отправки (запись прогресса, очередь): строка останется в очереди до следующего прохода
+                if isinstance(result, Exception):
+                    logger.error(f"Ошибка доставки {item.app_key} {item.tag} в чат {item.chat_id}: {result!r}")
+        await _report_pruned(bot, started)
+        await prune_outbox(time.time() - OUTBOX_RETENTION_DAYS * 86400)
+        if attempted:
+            logger.info(f"Очередь рассылки обработана: {attempted} получателей, осталось {await count_pending_deliveries()}")
+
+async def _collect_outbox_depth():
+    OUTBOX_PENDING.set(await count_pending_deliveries())
+
+add_collector(_collect_outbox_depth)
+
+def start_outbox_drain(bot: Bot) -> Optional[asyncio.Task]:
+    """Запускает разбор очереди рассылки в фоне, если он ещё не идёт.
+
+    Очередь разбирает только ведущий экземпляр; на остальных возвращает None.
+    """
+    global _drain_task
+    if not leader.is_leader:
+        return None
+    if _drain_task is None or _drain_task.done():
+        _drain_task = asyncio.create_task(drain_outbox(bot))
+    return _drain_task
+
+async def resume_outbox_drain(bot: Bot):
+    """Периодически подхватывает строки очереди, поставленные другими экземплярами или оставшиеся после сбоя."""
+    start_outbox_drain(bot)
+
+async def stop_outbox_drain():
+    """Прерывает разбор очереди (при потере лидерства). Недоставленные строки останутся в очереди."""
+    global _drain_task
+    if _drain_task is not None and not _drain_task.done():
+        _drain_task.cancel()
+        try:
+            await _drain_task
+        except asyncio.CancelledError:
+            pass
+    _drain_task = None
 
 async def check_releases(bot: Bot):
     try:
-        apps = get_all_apps()
-        headers = {"Authorization": f"token {GITHUB_TOKEN}"} if GITHUB_TOKEN else {}
-        headers["Accept"] = "application/vnd.github+json"
-        headers["X-GitHub-Api-Version"] = "2022-11-28"
-        async with aiohttp.ClientSession() as session:
-            for app in apps:
-                if not app.asset_filters:
-                    logger.warning(f"Фильтры для {app.key} не указаны, пропускаем проверку обновлений")
-                    continue
-                release = await get_latest_release(app.repo)
-                if not release or release['tag_name'] == app.latest_release:
-                    continue
-                app.latest_release = release['tag_name']
-                save_app(app)
-                release_notes = release.get('body', 'Описание релиза отсутствует.')
-                caption = f"Новый релиз для {app.title}: {release['name']}\n{release_notes}"
-                for user_id in app.subscribers_users:
-                    sent = False
-                    for asset in release['assets']:
-                        if any(fnmatch.fnmatch(asset['name'], f.strip()) for f in app.asset_filters):
-                            asset_url = asset['browser_download_url']
-                            logger.info(f"Загрузка файла для пользователя {user_id}: {asset_url} (имя: {asset['name']})")
-                            try:
-                                async with session.get(asset_url, headers=headers) as resp:
-                                    if resp.status != 200:
-                                        logger.error(f"Файл недоступен: {asset_url}, статус {resp.status}")
-                                        continue
-                                    file_data = await resp.read()
-                                    await bot.send_document(
-                                        chat_id=user_id,
-                                        document=BufferedInputFile(file_data, filename=asset['name']),
-                                        caption=caption if not sent else None
-                                    )
-                                    sent = True
-                                    logger.info(f"Отправлен файл {asset['name']} для {app.title} пользователю {user_id}")
-                            except Exception as e:
-                                logger.error(f"Ошибка загрузки файла {asset['name']} для пользователя {user_id}: {e}")
-                for chat_id in app.subscribers_chats:
-                    sent = False
-                    for asset in release['assets']:
-                        if any(fnmatch.fnmatch(asset['name'], f.strip()) for f in app.asset_filters):
-                            asset_url = asset['browser_download_url']
-                            logger.info(f"Загрузка файла для чата {chat_id}: {asset_url} (имя: {asset['name']})")
-                            try:
-                                async with session.get(asset_url, headers=headers) as resp:
-                                    if resp.status != 200:
-                                        logger.error(f"Файл недоступен: {asset_url}, статус {resp.status}")
-                                        continue
-                                    file_data = await resp.read()
-                                    await bot.send_document(
-                                        chat_id=chat_id,
-                                        document=BufferedInputFile(file_data, filename=asset['name']),
-                                        caption=caption if not sent else None
-                                    )
-                                    sent = True
-                                    logger.info(f"Отправлен файл {asset['name']} для {app.title} в чат {chat_id}")
-                            except Exception as e:
-                                logger.error(f"Ошибка загрузки файла {asset['name']} для чата {chat_id}: {e}")
+        apps = []
+        for app in get_all_apps():
+            if not app.asset_filters:
+                logger.warning(f"Фильтры для {app.key} не указаны, пропускаем проверку обновлений")
+                continue
+            apps.append(app)
+        started = time.monotonic()
+        updates = await poll_releases(apps)
+        elapsed = time.monotonic() - started
+        POLL_SWEEP_SECONDS.observe(elapsed)
+        POLL_LAST_SWEEP.set(time.time())
+        RELEASES_DETECTED.inc(len(updates))
+        logger.info(f"Проверено {len(apps)} приложений за {elapsed:.1f} с, новых релизов: {len(updates)}")
+        for app, release in updates:
+            release_notes = release.get('body', 'Описание релиза отсутствует.')
+            caption = f"Новый релиз для {app.title}: {release['name']}\n{release_notes}"
+            try:
+                assets = get_matcher(app).select(release['assets'])
+            except ValueError as e:
+                logger.error(f"Недопустимые фильтры для {app.key}: {e}")
+                continue
+            app.latest_release = release['tag_name']
+            count = await enqueue_release(app, release['tag_name'], caption, assets) if assets else 0
+            if not assets:
+                await save_app(app)
+            logger.info(f"Релиз {release['tag_name']} для {app.title} поставлен в очередь для {count} получателей")
+        start_outbox_drain(bot)
     except Exception as e:
         logger.error(f"Ошибка в check_releases: {e}")
\ No newline at end of file
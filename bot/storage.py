@@ -1,87 +1,709 @@
+import ast
+import asyncio
+import json
+import logging
 import sqlite3
-from bot.models import App
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+from bot.models import App, Delivery
 from bot.config import DB_PATH
 
-def init_db():
-    """Инициализирует базу данных, если таблица отсутствует."""
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS apps (
-                key TEXT PRIMARY KEY,
-                title TEXT,
-                link TEXT,
-                repo TEXT,
-                asset_filters TEXT,
-                subscribers_users TEXT,
-                subscribers_chats TEXT,
-                latest_release TEXT
-            )
-        ''')
-        conn.commit()
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Типы подписчиков в таблице subscriptions
+KIND_USER = "user"
+KIND_CHAT = "chat"
+
+# Состояния строк очереди рассылки outbox
+OUTBOX_PENDING = "pending"
+OUTBOX_DONE = "done"
+OUTBOX_FAILED = "failed"
+# Получатель недоступен (удалён из рассылки) или строка продублировала уже поставленную при переносе группы
+OUTBOX_DROPPED = "dropped"
+
+# Кэш каталога приложений: ключ -> App. Загружается в init_db, обновляется при каждой записи.
+# get_app, get_all_apps и проверки подписки читают только его и к базе не обращаются.
+_catalog: Optional[Dict[str, App]] = None
+# Версия каталога в базе (catalog_version) и PRAGMA data_version на момент загрузки кэша,
+# а также счётчик изменений кэша этим процессом, чтобы перезагрузка не затёрла их
+_catalog_version: Optional[int] = None
+_data_version: Optional[int] = None
+_local_changes = 0
+# Счётчик изменений самих приложений (без подписок) этим процессом
+_app_changes = 0
+
+# Все запросы к базе выполняются в одном потоке на одном соединении в режиме WAL,
+# чтобы медленный диск или ожидание блокировки не останавливали цикл событий
+_executor: Optional[ThreadPoolExecutor] = None
+_conn: Optional[sqlite3.Connection] = None
+
+# Одиночные записи, ожидающие общей транзакции: (sql, параметры, future, цикл событий)
+_pending_writes: list = []
+_pending_lock = threading.Lock()
+_flush_scheduled = False
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS apps (
+        key TEXT PRIMARY KEY,
+        title TEXT,
+        link TEXT,
+        repo TEXT,
+        asset_filters TEXT,
+        subscribers_users TEXT,
+        subscribers_chats TEXT,
+        latest_release TEXT,
+        album INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS subscriptions (
+        app_key TEXT NOT NULL,
+        chat_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        PRIMARY KEY (app_key, chat_id, kind)
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_subscriptions_chat ON subscriptions (chat_id, kind)",
+    '''
+    CREATE TABLE IF NOT EXISTS file_ids (
+        repo TEXT,
+        tag TEXT,
+        asset_name TEXT,
+        file_id TEXT,
+        PRIMARY KEY (repo, tag, asset_name)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS github_cache (
+        url TEXT PRIMARY KEY,
+        etag TEXT,
+        last_modified TEXT,
+        body TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS outbox_releases (
+        app_key TEXT NOT NULL,
+        tag TEXT NOT NULL,
+        repo TEXT NOT NULL,
+        caption TEXT,
+        assets TEXT NOT NULL,
+        PRIMARY KEY (app_key, tag)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        app_key TEXT NOT NULL,
+        tag TEXT NOT NULL,
+        chat_id INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        sent_assets INTEGER NOT NULL DEFAULT 0,
+        caption_sent INTEGER NOT NULL DEFAULT 0,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        updated_at REAL,
+        UNIQUE (app_key, tag, chat_id)
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox (status, id)",
+    "CREATE INDEX IF NOT EXISTS idx_outbox_chat ON outbox (chat_id, status)",
+    # Отчёт для администратора: недоступные получатели, удалённые из рассылки, и перенесённые группы
+    '''
+    CREATE TABLE IF NOT EXISTS pruned_recipients (
+        chat_id INTEGER PRIMARY KEY,
+        reason TEXT NOT NULL,
+        apps TEXT NOT NULL,
+        migrated_to INTEGER,
+        pruned_at REAL NOT NULL
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_pruned_recipients_time ON pruned_recipients (pruned_at)",
+    # Версия каталога растёт при любом изменении приложений и подписок, в том числе из других процессов
+    "CREATE TABLE IF NOT EXISTS catalog_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)",
+] + [
+    f"CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version AFTER {event} ON {table} "
+    f"BEGIN UPDATE catalog_version SET version = version + 1; END"
+    for table in ("apps", "subscriptions") for event in ("INSERT", "UPDATE", "DELETE")
+]
+
+class _transaction:
+    """Транзакция для соединения в режиме autocommit: COMMIT при успехе, ROLLBACK при ошибке."""
+
+    def __init__(self, conn: sqlite3.Connection, immediate: bool = True):
+        self.conn = conn
+        self.immediate = immediate
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE" if self.immediate else "BEGIN")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+def _connect() -> sqlite3.Connection:
+    """Открывает соединение (в потоке хранилища), включает WAL и создаёт схему."""
+    conn = sqlite3.connect(DB_PATH, isolation_level=None, check_same_thread=False, cached_statements=256)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    with _transaction(conn):
+        for statement in SCHEMA:
+            conn.execute(statement)
+        _migrate_columns(conn)
+        _migrate_subscriptions(conn)
+    return conn
+
+async def _run(fn: Callable[[sqlite3.Connection], T]) -> T:
+    """Выполняет fn(conn) в потоке хранилища."""
+    if _executor is None:
+        raise RuntimeError("Хранилище не инициализировано: вызовите await init_db()")
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, _conn)
+
+def _flush_writes(conn: sqlite3.Connection):
+    """Выполняет накопленные одиночные записи одной транзакцией (в потоке хранилища).
+
+    Каждая запись идёт в своей точке сохранения, поэтому ошибка одной не отменяет остальные.
+    """
+    global _flush_scheduled
+    with _pending_lock:
+        batch = list(_pending_writes)
+        _pending_writes.clear()
+        _flush_scheduled = False
+    if not batch:
+        return
+    results = []
+    try:
+        with _transaction(conn):
+            for sql, params, _, _ in batch:
+                conn.execute("SAVEPOINT write")
+                try:
+                    results.append(conn.execute(sql, params).rowcount)
+                    conn.execute("RELEASE write")
+                except Exception as e:
+                    # Не только ошибки SQLite: неверные параметры (например, OverflowError) тоже
+                    # должны завершить future этой записи, иначе вызывающий ждал бы вечно
+                    conn.execute("ROLLBACK TO write")
+                    conn.execute("RELEASE write")
+                    results.append(e)
+    except Exception as e:
+        results = [e] * len(batch)
+    for (_, _, future, loop), result in zip(batch, results):
+        try:
+            loop.call_soon_threadsafe(_set_future, future, result)
+        except RuntimeError:
+            # Цикл событий вызывающего уже закрыт
+            pass
+
+def _set_future(future: asyncio.Future, result):
+    if future.done():
+        return
+    if isinstance(result, Exception):
+        future.set_exception(result)
+    else:
+        future.set_result(result)
+
+def _log_flush_error(task: asyncio.Future):
+    if not task.cancelled() and task.exception():
+        logger.error(f"Ошибка записи в базу: {task.exception()}")
+
+async def _write(sql: str, params: tuple = ()) -> int:
+    """Добавляет одиночную запись в общую транзакцию и ждёт её фиксации. Возвращает rowcount."""
+    global _flush_scheduled
+    if _executor is None:
+        raise RuntimeError("Хранилище не инициализировано: вызовите await init_db()")
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    with _pending_lock:
+        _pending_writes.append((sql, params, future, loop))
+        schedule = not _flush_scheduled
+        _flush_scheduled = True
+    if schedule:
+        loop.run_in_executor(_executor, _flush_writes, _conn).add_done_callback(_log_flush_error)
+    return await future
+
+async def init_db():
+    """Открывает соединение с базой, создаёт схему и загружает каталог приложений в память."""
+    global _executor, _conn
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
+        _conn = await asyncio.get_running_loop().run_in_executor(_executor, _connect)
+    await load_catalog()
+
+async def close_db():
+    """Дожидается незаписанных изменений и закрывает соединение с базой."""
+    global _executor, _conn, _catalog
+    if _executor is None:
+        return
+    executor, conn = _executor, _conn
+    await asyncio.get_running_loop().run_in_executor(executor, conn.close)
+    executor.shutdown(wait=True)
+    _executor, _conn, _catalog = None, None, None
+
+def _load_list(value: Optional[str]) -> list:
+    """Разбирает список, сохранённый в столбце как JSON или как str(list)."""
+    if not value:
+        return []
+    try:
+        return list(json.loads(value))
+    except ValueError:
+        # Строки старых версий записаны как str(list) с одинарными кавычками
+        return list(ast.literal_eval(value))
+
+# Столбцы, добавленные после первого выпуска: таблица -> [(столбец, определение, заполнение старых строк)]
+ADDED_COLUMNS = {
+    "apps": [("album", "INTEGER NOT NULL DEFAULT 0", None)],
+    # Раньше подпись всегда уходила с первым файлом, поэтому у начатых доставок она уже отправлена
+    "outbox": [("caption_sent", "INTEGER NOT NULL DEFAULT 0", "UPDATE outbox SET caption_sent = 1 WHERE sent_assets > 0")],
+}
+
+def _migrate_columns(conn: sqlite3.Connection):
+    """Добавляет в таблицы старой базы столбцы, которых в ней ещё нет."""
+    for table, columns in ADDED_COLUMNS.items():
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for name, definition, backfill in columns:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+                if backfill:
+                    conn.execute(backfill)
+
+def _migrate_subscriptions(conn: sqlite3.Connection):
+    """Переносит подписчиков из старых столбцов-списков apps в таблицу subscriptions."""
+    legacy = conn.execute(
+        "SELECT key, subscribers_users, subscribers_chats FROM apps "
+        "WHERE subscribers_users IS NOT NULL OR subscribers_chats IS NOT NULL"
+    ).fetchall()
+    if not legacy:
+        return
+    for key, users, chats in legacy:
+        rows = [(key, chat_id, KIND_USER) for chat_id in _load_list(users)]
+        rows += [(key, chat_id, KIND_CHAT) for chat_id in _load_list(chats)]
+        conn.executemany("INSERT OR IGNORE INTO subscriptions (app_key, chat_id, kind) VALUES (?, ?, ?)", rows)
+    conn.execute("UPDATE apps SET subscribers_users = NULL, subscribers_chats = NULL")
+
+def _row_to_app(row: tuple, subscribers: Dict[str, List[int]]) -> App:
+    return App(
+        key=row[0],
+        title=row[1],
+        link=row[2],
+        repo=row[3],
+        asset_filters=_load_list(row[4]),
+        subscribers_users=subscribers.get(KIND_USER, []),
+        subscribers_chats=subscribers.get(KIND_CHAT, []),
+        latest_release=row[5],
+        album=bool(row[6])
+    )
+
+async def load_catalog():
+    """Загружает каталог приложений с подписчиками из базы в память."""
+    global _catalog, _catalog_version, _data_version
+
+    def load(conn: sqlite3.Connection) -> Tuple[Dict[str, App], int, int]:
+        with _transaction(conn, immediate=False):
+            version = conn.execute("SELECT version FROM catalog_version").fetchone()[0]
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            rows = conn.execute(
+                "SELECT key, title, link, repo, asset_filters, latest_release, album FROM apps ORDER BY rowid"
+            ).fetchall()
+            subscribers = {}
+            for app_key, chat_id, kind in conn.execute(
+                "SELECT app_key, chat_id, kind FROM subscriptions ORDER BY rowid"
+            ):
+                subscribers.setdefault(app_key, {}).setdefault(kind, []).append(chat_id)
+        return {row[0]: _row_to_app(row, subscribers.get(row[0], {})) for row in rows}, version, data_version
+
+    while True:
+        changes = _local_changes
+        catalog, version, data_version = await _run(load)
+        # Если кэш изменился во время чтения, снимок мог не застать это изменение
+        if changes == _local_changes:
+            break
+    _catalog, _catalog_version, _data_version = catalog, version, data_version
+
+async def refresh_catalog() -> bool:
+    """Перечитывает каталог, если приложения или подписки изменил другой процесс.
+
+    PRAGMA data_version меняется только после записи другим соединением, поэтому
+    без других процессов проверка не читает таблиц. Возвращает True, если каталог перечитан.
+    """
+    def changed_version(conn: sqlite3.Connection) -> Optional[int]:
+        global _data_version
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == _data_version:
+            return None
+        _data_version = data_version
+        return conn.execute("SELECT version FROM catalog_version").fetchone()[0]
+
+    version = await _run(changed_version)
+    if version is None or version == _catalog_version:
+        return False
+    await load_catalog()
+    return True
+
+def _catalog_changed(apps: bool = False):
+    global _local_changes, _app_changes
+    _local_changes += 1
+    if apps:
+        _app_changes += 1
+
+def catalog_revision() -> Tuple[int, Optional[int]]:
+    """Отметка состояния кэша каталога: меняется при любом изменении приложений или подписок."""
+    return _local_changes, _catalog_version
+
+def apps_revision() -> Tuple[int, Optional[int]]:
+    """Отметка состояния приложений в кэше: как catalog_revision, но не меняется при подписке и отписке."""
+    return _app_changes, _catalog_version
+
+def _get_catalog() -> Dict[str, App]:
+    if _catalog is None:
+        raise RuntimeError("Каталог не загружен: вызовите await init_db()")
+    return _catalog
 
 def get_all_apps():
-    """Возвращает список всех приложений из базы данных."""
-    init_db()
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM apps")
-        rows = cursor.fetchall()
-        return [App(
-            key=row[0],
-            title=row[1],
-            link=row[2],
-            repo=row[3],
-            asset_filters=eval(row[4]) if row[4] else [],
-            subscribers_users=eval(row[5]) if row[5] else [],
-            subscribers_chats=eval(row[6]) if row[6] else [],
-            latest_release=row[7]
-        ) for row in rows]
+    """Возвращает список всех приложений из кэша каталога."""
+    return [replace(app) for app in _get_catalog().values()]
 
 def get_app(key: str):
-    """Возвращает приложение по ключу."""
-    init_db()
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM apps WHERE key = ?", (key,))
-        row = cursor.fetchone()
-        if row:
-            return App(
-                key=row[0],
-                title=row[1],
-                link=row[2],
-                repo=row[3],
-                asset_filters=eval(row[4]) if row[4] else [],
-                subscribers_users=eval(row[5]) if row[5] else [],
-                subscribers_chats=eval(row[6]) if row[6] else [],
-                latest_release=row[7]
+    """Возвращает приложение по ключу из кэша каталога."""
+    app = _get_catalog().get(key)
+    return replace(app) if app else None
+
+async def save_app(app: App):
+    """Сохраняет приложение в базу данных и кэш. Подписчики хранятся отдельно, см. subscribe/unsubscribe."""
+    await _write('''
+        INSERT INTO apps (key, title, link, repo, asset_filters, latest_release, album)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(key) DO UPDATE SET
+            title = excluded.title,
+            link = excluded.link,
+            repo = excluded.repo,
+            asset_filters = excluded.asset_filters,
+            latest_release = excluded.latest_release,
+            album = excluded.album
+    ''', (
+        app.key,
+        app.title,
+        app.link,
+        app.repo,
+        json.dumps(app.asset_filters),
+        app.latest_release,
+        int(app.album)
+    ))
+    catalog = _get_catalog()
+    _catalog_changed(apps=True)
+    cached = catalog.get(app.key)
+    catalog[app.key] = replace(
+        app,
+        asset_filters=list(app.asset_filters),
+        subscribers_users=cached.subscribers_users if cached else [],
+        subscribers_chats=cached.subscribers_chats if cached else []
+    )
+
+async def delete_app(key: str):
+    """Удаляет приложение по ключу вместе с его подписками."""
+    def delete(conn: sqlite3.Connection):
+        with _transaction(conn):
+            conn.execute("DELETE FROM apps WHERE key = ?", (key,))
+            conn.execute("DELETE FROM subscriptions WHERE app_key = ?", (key,))
+
+    await _run(delete)
+    _catalog_changed(apps=True)
+    _get_catalog().pop(key, None)
+
+def _cache_subscription(app_key: str, chat_id: int, kind: str, subscribed: bool):
+    """Обновляет подписчиков приложения в кэше. Списки заменяются, а не изменяются на месте,
+    чтобы не затронуть копии, которые сейчас обходит рассылка."""
+    _catalog_changed()
+    app = _get_catalog().get(app_key)
+    if not app:
+        return
+    field = "subscribers_users" if kind == KIND_USER else "subscribers_chats"
+    current = getattr(app, field)
+    if subscribed and chat_id not in current:
+        setattr(app, field, current + [chat_id])
+    elif not subscribed and chat_id in current:
+        setattr(app, field, [item for item in current if item != chat_id])
+
+async def subscribe(app_key: str, chat_id: int, kind: str) -> bool:
+    """Подписывает пользователя или чат на приложение. Возвращает False, если подписка уже была."""
+    added = await _write(
+        "INSERT OR IGNORE INTO subscriptions (app_key, chat_id, kind) VALUES (?, ?, ?)",
+        (app_key, chat_id, kind)
+    ) > 0
+    _cache_subscription(app_key, chat_id, kind, True)
+    return added
+
+async def unsubscribe(app_key: str, chat_id: int, kind: str) -> bool:
+    """Отписывает пользователя или чат от приложения. Возвращает False, если подписки не было."""
+    removed = await _write(
+        "DELETE FROM subscriptions WHERE app_key = ? AND chat_id = ? AND kind = ?",
+        (app_key, chat_id, kind)
+    ) > 0
+    _cache_subscription(app_key, chat_id, kind, False)
+    return removed
+
+async def toggle_subscriber(app_key: str, chat_id: int, kind: str) -> bool:
+    """Атомарно переключает подписку. Возвращает True, если после вызова подписка есть."""
+    def toggle(conn: sqlite3.Connection) -> bool:
+        with _transaction(conn):
+            removed = conn.execute(
+                "DELETE FROM subscriptions WHERE app_key = ? AND chat_id = ? AND kind = ?",
+                (app_key, chat_id, kind)
+            ).rowcount
+            if not removed:
+                conn.execute(
+                    "INSERT INTO subscriptions (app_key, chat_id, kind) VALUES (?, ?, ?)",
+                    (app_key, chat_id, kind)
+                )
+        return not removed
+
+    subscribed = await _run(toggle)
+    _cache_subscription(app_key, chat_id, kind, subscribed)
+    return subscribed
+
+def is_subscribed(app_key: str, chat_id: int, kind: str) -> bool:
+    """Проверяет, подписан ли пользователь или чат на приложение."""
+    app = _get_catalog().get(app_key)
+    if not app:
+        return False
+    return chat_id in (app.subscribers_users if kind == KIND_USER else app.subscribers_chats)
+
+def get_subscriber_counts() -> Dict[str, Tuple[int, int]]:
+    """Возвращает количество подписчиков по приложениям: {key: (пользователи, чаты)}."""
+    return {
+        key: (len(app.subscribers_users), len(app.subscribers_chats))
+        for key, app in _get_catalog().items()
+    }
+
+async def get_subscribed_apps(chat_id: int, kind: str) -> List[str]:
+    """Возвращает ключи приложений, на которые подписан пользователь или чат."""
+    return await _run(lambda conn: [row[0] for row in conn.execute(
+        "SELECT app_key FROM subscriptions WHERE chat_id = ? AND kind = ? ORDER BY app_key",
+        (chat_id, kind)
+    )])
+
+async def prune_recipient(chat_id: int, reason: str) -> List[str]:
+    """Удаляет все подписки недоступного получателя и снимает его строки с очереди рассылки.
+
+    Удаление записывается в отчёт pruned_recipients. Возвращает ключи приложений, от которых
+    получатель отписан (пустой список, если подписок уже не было).
+    """
+    def prune(conn: sqlite3.Connection) -> List[Tuple[str, str]]:
+        with _transaction(conn):
+            rows = conn.execute(
+                "SELECT app_key, kind FROM subscriptions WHERE chat_id = ? ORDER BY app_key", (chat_id,)
+            ).fetchall()
+            conn.execute("DELETE FROM subscriptions WHERE chat_id = ?", (chat_id,))
+            conn.execute(
+                "UPDATE outbox SET status = ?, updated_at = ? WHERE chat_id = ? AND status = ?",
+                (OUTBOX_DROPPED, time.time(), chat_id, OUTBOX_PENDING)
+            )
+            if rows:
+                conn.execute(
+                    "INSERT OR REPLACE INTO pruned_recipients (chat_id, reason, apps, migrated_to, pruned_at) "
+                    "VALUES (?, ?, ?, NULL, ?)",
+                    (chat_id, reason, json.dumps(sorted({key for key, _ in rows})), time.time())
+                )
+        return rows
+
+    rows = await _run(prune)
+    for app_key, kind in rows:
+        _cache_subscription(app_key, chat_id, kind, False)
+    return sorted({key for key, _ in rows})
+
+async def migrate_recipient(old_chat_id: int, new_chat_id: int) -> List[str]:
+    """Переносит подписки и недоставленные строки очереди группы на id супергруппы.
+
+    Перенос записывается в отчёт pruned_recipients. Возвращает ключи перенесённых подписок.
+    """
+    def migrate(conn: sqlite3.Connection) -> List[Tuple[str, str]]:
+        with _transaction(conn):
+            rows = conn.execute(
+                "SELECT app_key, kind FROM subscriptions WHERE chat_id = ? ORDER BY app_key", (old_chat_id,)
+            ).fetchall()
+            # Подписки и строки, которые у супергруппы уже есть, не дублируются
+            conn.execute("UPDATE OR IGNORE subscriptions SET chat_id = ? WHERE chat_id = ?", (new_chat_id, old_chat_id))
+            conn.execute("DELETE FROM subscriptions WHERE chat_id = ?", (old_chat_id,))
+            conn.execute(
+                "UPDATE OR IGNORE outbox SET chat_id = ?, updated_at = ? WHERE chat_id = ? AND status = ?",
+                (new_chat_id, time.time(), old_chat_id, OUTBOX_PENDING)
+            )
+            conn.execute(
+                "UPDATE outbox SET status = ?, updated_at = ? WHERE chat_id = ? AND status = ?",
+                (OUTBOX_DROPPED, time.time(), old_chat_id, OUTBOX_PENDING)
+            )
+            if rows:
+                conn.execute(
+                    "INSERT OR REPLACE INTO pruned_recipients (chat_id, reason, apps, migrated_to, pruned_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (old_chat_id, "group migrated to supergroup", json.dumps(sorted({key for key, _ in rows})),
+                     new_chat_id, time.time())
+                )
+        return rows
+
+    rows = await _run(migrate)
+    for app_key, kind in rows:
+        _cache_subscription(app_key, old_chat_id, kind, False)
+        _cache_subscription(app_key, new_chat_id, kind, True)
+    return sorted({key for key, _ in rows})
+
+async def get_pruned_recipients(limit: int) -> List[Tuple[int, str, List[str], Optional[int], float]]:
+    """Возвращает последние записи отчёта: (chat_id, причина, приложения, новый id группы или None, время)."""
+    rows = await _run(lambda conn: conn.execute(
+        "SELECT chat_id, reason, apps, migrated_to, pruned_at FROM pruned_recipients "
+        "ORDER BY pruned_at DESC LIMIT ?", (limit,)
+    ).fetchall())
+    return [(row[0], row[1], json.loads(row[2]), row[3], row[4]) for row in rows]
+
+async def count_pruned_recipients(since: float) -> Tuple[int, int]:
+    """Возвращает (удалено получателей, перенесено групп) начиная с since (unix time)."""
+    row = await _run(lambda conn: conn.execute(
+        "SELECT COUNT(*) - COUNT(migrated_to), COUNT(migrated_to) FROM pruned_recipients WHERE pruned_at >= ?",
+        (since,)
+    ).fetchone())
+    return row[0], row[1]
+
+async def get_file_id(repo: str, tag: str, asset_name: str) -> Optional[str]:
+    """Возвращает сохранённый Telegram file_id для файла релиза, если он уже загружался."""
+    row = await _run(lambda conn: conn.execute(
+        "SELECT file_id FROM file_ids WHERE repo = ? AND tag = ? AND asset_name = ?",
+        (repo, tag, asset_name)
+    ).fetchone())
+    return row[0] if row else None
+
+async def save_file_id(repo: str, tag: str, asset_name: str, file_id: str):
+    """Сохраняет Telegram file_id файла релиза для повторной отправки без загрузки."""
+    await _write(
+        "INSERT OR REPLACE INTO file_ids (repo, tag, asset_name, file_id) VALUES (?, ?, ?, ?)",
+        (repo, tag, asset_name, file_id)
+    )
+
+async def delete_file_id(repo: str, tag: str, asset_name: str):
+    """Удаляет недействительный file_id из кэша."""
+    await _write(
+        "DELETE FROM file_ids WHERE repo = ? AND tag = ? AND asset_name = ?",
+        (repo, tag, asset_name)
+    )
+
+async def get_cached_response(url: str) -> Optional[Tuple[Optional[str], Optional[str], dict]]:
+    """Возвращает (ETag, Last-Modified, тело) сохранённого ответа GitHub API."""
+    row = await _run(lambda conn: conn.execute(
+        "SELECT etag, last_modified, body FROM github_cache WHERE url = ?", (url,)
+    ).fetchone())
+    return (row[0], row[1], json.loads(row[2])) if row else None
+
+async def save_cached_response(url: str, etag: Optional[str], last_modified: Optional[str], body: dict):
+    """Сохраняет ответ GitHub API вместе с валидаторами для условных запросов."""
+    await _write(
+        "INSERT OR REPLACE INTO github_cache (url, etag, last_modified, body) VALUES (?, ?, ?, ?)",
+        (url, etag, last_modified, json.dumps(body))
+    )
+
+async def enqueue_release(app: App, tag: str, caption: str, assets: List[dict]) -> int:
+    """Одной транзакцией запоминает новый тег приложения и ставит релиз в очередь всем подписчикам.
+
+    Возвращает количество поставленных в очередь получателей.
+    """
+    def enqueue(conn: sqlite3.Connection) -> int:
+        with _transaction(conn):
+            conn.execute("UPDATE apps SET latest_release = ? WHERE key = ?", (tag, app.key))
+            conn.execute(
+                "INSERT OR REPLACE INTO outbox_releases (app_key, tag, repo, caption, assets) VALUES (?, ?, ?, ?, ?)",
+                (app.key, tag, app.repo, caption, json.dumps(assets))
             )
-        return None
-
-def save_app(app: App):
-    """Сохраняет приложение в базу данных."""
-    init_db()
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO apps (key, title, link, repo, asset_filters, subscribers_users, subscribers_chats, latest_release)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            app.key,
-            app.title,
-            app.link,
-            app.repo,
-            str(app.asset_filters),
-            str(app.subscribers_users),
-            str(app.subscribers_chats),
-            app.latest_release
-        ))
-        conn.commit()
-
-def delete_app(key: str):
-    """Удаляет приложение по ключу."""
-    init_db()
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM apps WHERE key = ?", (key,))
-        conn.commit()
\ No newline at end of file
+            return conn.execute('''
+                INSERT OR IGNORE INTO outbox (app_key, tag, chat_id, status, updated_at)
+                SELECT app_key, ?, chat_id, ?, ? FROM subscriptions WHERE app_key = ? ORDER BY rowid
+            ''', (tag, OUTBOX_PENDING, time.time(), app.key)).rowcount
+
+    count = await _run(enqueue)
+    _catalog_changed()
+    cached = _get_catalog().get(app.key)
+    if cached:
+        cached.latest_release = tag
+    return count
+
+async def get_pending_deliveries(limit: int, after_id: int = 0) -> List[Delivery]:
+    """Возвращает до limit недоставленных строк очереди с id больше after_id в порядке постановки."""
+    rows = await _run(lambda conn: conn.execute('''
+        SELECT o.id, o.app_key, r.repo, o.tag, o.chat_id, r.caption, r.assets, o.sent_assets, o.attempts,
+            o.caption_sent
+        FROM outbox o JOIN outbox_releases r ON r.app_key = o.app_key AND r.tag = o.tag
+        WHERE o.status = ? AND o.id > ? ORDER BY o.id LIMIT ?
+    ''', (OUTBOX_PENDING, after_id, limit)).fetchall())
+    return [Delivery(
+        id=row[0],
+        app_key=row[1],
+        repo=row[2],
+        tag=row[3],
+        chat_id=row[4],
+        caption=row[5],
+        assets=json.loads(row[6]),
+        sent_assets=row[7],
+        attempts=row[8],
+        caption_sent=bool(row[9])
+    ) for row in rows]
+
+async def update_delivery_progress(delivery_id: int, sent_assets: int):
+    """Запоминает, сколько файлов релиза уже обработано для получателя, и что подпись отправлена."""
+    await _write(
+        "UPDATE outbox SET sent_assets = ?, caption_sent = 1, updated_at = ? WHERE id = ?",
+        (sent_assets, time.time(), delivery_id)
+    )
+
+async def complete_delivery(delivery_id: int):
+    """Отмечает доставку выполненной."""
+    await _write(
+        "UPDATE outbox SET status = ?, updated_at = ? WHERE id = ?",
+        (OUTBOX_DONE, time.time(), delivery_id)
+    )
+
+async def fail_delivery(delivery_id: int, max_attempts: int) -> bool:
+    """Учитывает неудачную попытку доставки. Возвращает True, если попытки исчерпаны."""
+    def fail(conn: sqlite3.Connection) -> bool:
+        with _transaction(conn):
+            conn.execute('''
+                UPDATE outbox SET attempts = attempts + 1, updated_at = ?,
+                    status = CASE WHEN attempts + 1 >= ? THEN ? ELSE status END
+                WHERE id = ?
+            ''', (time.time(), max_attempts, OUTBOX_FAILED, delivery_id))
+            row = conn.execute("SELECT status FROM outbox WHERE id = ?", (delivery_id,)).fetchone()
+        return bool(row) and row[0] == OUTBOX_FAILED
+
+    return await _run(fail)
+
+async def is_delivery_pending(delivery_id: int) -> bool:
+    """Проверяет, что строка очереди всё ещё ожидает доставки (не снята при переносе или удалении получателя)."""
+    row = await _run(lambda conn: conn.execute("SELECT status FROM outbox WHERE id = ?", (delivery_id,)).fetchone())
+    return bool(row) and row[0] == OUTBOX_PENDING
+
+async def count_pending_deliveries() -> int:
+    """Возвращает количество недоставленных строк очереди."""
+    return await _run(lambda conn: conn.execute(
+        "SELECT COUNT(*) FROM outbox WHERE status = ?", (OUTBOX_PENDING,)
+    ).fetchone()[0])
+
+async def prune_outbox(older_than: float):
+    """Удаляет завершённые строки очереди и записи отчёта pruned_recipients старше older_than (unix time)
+    и неиспользуемые релизы."""
+    def prune(conn: sqlite3.Connection):
+        with _transaction(conn):
+            conn.execute(
+                "DELETE FROM outbox WHERE status != ? AND updated_at < ?",
+                (OUTBOX_PENDING, older_than)
+            )
+            conn.execute("DELETE FROM pruned_recipients WHERE pruned_at < ?", (older_than,))
+            conn.execute('''
+                DELETE FROM outbox_releases WHERE NOT EXISTS (
+                    SELECT 1 FROM outbox o WHERE o.app_key = outbox_releases.app_key AND o.tag = outbox_releases.tag
+                )
+            ''')
+
+    await _run(prune)
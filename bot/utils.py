@@ -1,5 +1,7 @@
 import re
 import logging
+from typing import List
+from bot.asset_filters import compile_filters
 
 logger = logging.getLogger(__name__)
 
@@ -11,4 +13,13 @@ def validate_repo(repo: str) -> bool:
 def validate_key(key: str) -> bool:
     """Проверяет, содержит ли ключ приложения только буквенно-цифровые символы и подчеркивания."""
     pattern = r"^[a-zA-Z0-9_]+$"
-    return bool(re.match(pattern, key))
\ No newline at end of file
+    return bool(re.match(pattern, key))
+
+def validate_asset_filters(filters: List[str]) -> bool:
+    """Проверяет, что фильтры файлов (шаблоны, re:, abi:, исключения !) компилируются."""
+    try:
+        compile_filters(tuple(filters))
+        return True
+    except ValueError as e:
+        logger.warning(f"Недопустимые фильтры {filters}: {e}")
+        return False
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import re
+import socket
+import ssl
+from typing import Optional
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import FSInputFile
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiogram.webhook.security import IPFilter
+from bot.config import (
+    WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_BEHIND_PROXY,
+    WEBHOOK_SSL_CERT, WEBHOOK_SSL_KEY, WEBHOOK_IP_FILTER, WEBHOOK_REGISTER
+)
+
+logger = logging.getLogger(__name__)
+
+SECRET_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,256}$")
+
+# SO_REUSEPORT (несколько воркеров на одном порту) есть в Linux и BSD, но не в Windows
+REUSE_PORT = hasattr(socket, "SO_REUSEPORT")
+
+def client_ip(request: web.Request) -> str:
+    """Адрес отправителя запроса. За прокси - последний адрес в X-Forwarded-For, добавленный самим прокси."""
+    if WEBHOOK_BEHIND_PROXY:
+        forwarded = request.headers.get("X-Forwarded-For", "")
+        if forwarded:
+            return forwarded.rsplit(",", 1)[-1].strip()
+    return request.remote or ""
+
+def ip_filter_middleware(ip_filter: IPFilter):
+    @web.middleware
+    async def middleware(request: web.Request, handler):
+        ip = client_ip(request)
+        if ip not in ip_filter:
+            logger.warning(f"Запрос к webhook с чужого адреса {ip} отклонён")
+            raise web.HTTPUnauthorized()
+        return await handler(request)
+    return middleware
+
+def _webhook_secret() -> Optional[str]:
+    # Случайный секрет каждого процесса не подходит: воркеры на одном порту зарегистрировали бы
+    # разные секреты, и обновления принимал бы только последний из них
+    if not WEBHOOK_SECRET:
+        logger.error("Для UPDATE_MODE=webhook нужно задать WEBHOOK_SECRET, общий для всех воркеров")
+        return None
+    if not SECRET_PATTERN.match(WEBHOOK_SECRET):
+        logger.error("WEBHOOK_SECRET может содержать только A-Z, a-z, 0-9, _ и - (до 256 символов)")
+        return None
+    return WEBHOOK_SECRET
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Принимает обновления через webhook на встроенном HTTP-сервере до остановки процесса.
+
+    Telegram подтверждается сразу, а обновление обрабатывается в фоне. На одном порту можно
+    запустить несколько воркеров (SO_REUSEPORT, кроме Windows); webhook при этом регистрирует один из них.
+    """
+    if not WEBHOOK_BASE_URL:
+        logger.error("Для UPDATE_MODE=webhook нужно задать WEBHOOK_BASE_URL")
+        return
+    secret = _webhook_secret()
+    if not secret:
+        return
+    ssl_context = None
+    if not WEBHOOK_BEHIND_PROXY:
+        if not (WEBHOOK_SSL_CERT and WEBHOOK_SSL_KEY):
+            logger.error("Без обратного прокси нужны WEBHOOK_SSL_CERT и WEBHOOK_SSL_KEY")
+            return
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.load_cert_chain(WEBHOOK_SSL_CERT, WEBHOOK_SSL_KEY)
+
+    app = web.Application(middlewares=[ip_filter_middleware(IPFilter.default())] if WEBHOOK_IP_FILTER else [])
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT, ssl_context=ssl_context, reuse_port=REUSE_PORT)
+        await site.start()
+        url = f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}"
+        if WEBHOOK_REGISTER:
+            await bot.set_webhook(
+                url,
+                secret_token=secret,
+                certificate=FSInputFile(WEBHOOK_SSL_CERT) if ssl_context else None,
+                allowed_updates=dp.resolve_used_update_types()
+            )
+            logger.info(f"Webhook зарегистрирован: {url}")
+        logger.info(f"Приём обновлений через webhook на {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()